@@ -0,0 +1,147 @@
+""" Anytime sampling: instead of drawing a fixed number of samples, a query
+keeps sampling in batches until its posterior estimate is precise enough, a
+time budget runs out, or a sample limit is hit. After every batch the
+current estimate, its effective sample size and a confidence interval for
+each value are available."""
+
+import random
+import time
+
+from BayesNet.convergence import MIN_SAMPLES, Z_95, effectiveSampleSize, wilsonInterval
+
+# No query is declared converged before this many samples have been drawn.
+# With unlikely evidence, likelihood weighting can go thousands of samples
+# without reaching the branch that explains the evidence; until it does,
+# every weight is equal, so the effective sample size is the sample count
+# and the intervals look tight around a badly wrong estimate
+MIN_ANYTIME_SAMPLES = 10000
+
+
+class AnytimeEstimate:
+    """The state of an anytime query after some number of batches: the
+    estimated probability of each query value, the confidence interval
+    around each one, the effective sample size, the number of samples drawn
+    (and, for rejection sampling, how many matched the evidence), the time
+    taken so far, and whether the precision target has been met"""
+
+    def __init__(self, probs, intervals, effectiveSamples, samplesDrawn, accepted, elapsed, converged):
+        self.probs = probs
+        self.intervals = intervals
+        self.effectiveSamples = effectiveSamples
+        self.samplesDrawn = samplesDrawn
+        self.accepted = accepted
+        self.elapsed = elapsed
+        self.converged = converged
+
+    def maxWidth(self):
+        """Returns the width of the widest confidence interval"""
+        return max(high - low for (low, high) in self.intervals.values())
+
+    def __repr__(self):
+        return ("AnytimeEstimate(probs=" + str(self.probs) +
+                ", effectiveSamples=" + str(round(self.effectiveSamples, 1)) +
+                ", samplesDrawn=" + str(self.samplesDrawn) +
+                ", converged=" + str(self.converged) + ")")
+
+
+def anytimeSample(compiled, queryId, evidence, method="likelihood", precision=None,
+                  timeBudget=None, maxSamples=None, batchSize=1000, rand=random.random,
+                  report=None, z=Z_95):
+    """Estimates the posterior of the query node (an id in the CompiledNet)
+    given evidence (a dictionary of node ids to value ids), with method
+    either "likelihood" (likelihood weighting) or "rejection". Samples are
+    drawn batchSize at a time. Sampling stops once the estimate has
+    converged, once timeBudget seconds have passed, or once
+    maxSamples samples have been drawn, whichever comes first; at least one
+    of the three must be given. The estimate has converged when, after at
+    least MIN_ANYTIME_SAMPLES samples and with an effective sample size of
+    at least MIN_SAMPLES, every value's confidence interval is at most
+    precision wide for two batches in a row, and no estimate moved by more
+    than precision between them. If report is given, it is called with an
+    AnytimeEstimate after every batch. Returns the final AnytimeEstimate"""
+    if precision is None and timeBudget is None and maxSamples is None:
+        raise ValueError("Anytime sampling needs a precision, a time budget or a sample limit")
+    if method not in ("likelihood", "rejection"):
+        raise ValueError("Unknown anytime sampling method: " + str(method))
+    card = compiled.cards[queryId]
+    sums = [0.0] * card
+    squaredSums = [0.0] * card
+    weightSum = 0.0
+    squaredWeightSum = 0.0
+    drawn = 0
+    accepted = 0
+    assignment = [0] * len(compiled)
+    numNodes = max(list(evidence) + [queryId]) + 1
+    start = time.perf_counter()
+    estimate = None
+    while True:
+        batch = batchSize
+        if maxSamples is not None:
+            batch = min(batch, maxSamples - drawn)
+        for i in range(batch):
+            if method == "likelihood":
+                (sample, weight) = compiled.weightedSample(evidence, rand)
+                if weight > 0.0:
+                    sums[sample[queryId]] += weight
+                    squaredSums[sample[queryId]] += weight * weight
+                    weightSum += weight
+                    squaredWeightSum += weight * weight
+                    accepted += 1
+            elif compiled.rejectionSample(evidence, assignment, rand, numNodes):
+                sums[assignment[queryId]] += 1.0
+                squaredSums[assignment[queryId]] += 1.0
+                weightSum += 1.0
+                squaredWeightSum += 1.0
+                accepted += 1
+        drawn += batch
+        elapsed = time.perf_counter() - start
+        estimate = _makeEstimate(compiled, queryId, sums, squaredSums, weightSum, squaredWeightSum,
+                                 drawn, accepted, elapsed, precision, z, estimate)
+        if report is not None:
+            report(estimate)
+        if estimate.converged:
+            break
+        if timeBudget is not None and elapsed >= timeBudget:
+            break
+        if maxSamples is not None and drawn >= maxSamples:
+            break
+    return estimate
+
+
+def _makeEstimate(compiled, queryId, sums, squaredSums, weightSum, squaredWeightSum,
+                  drawn, accepted, elapsed, precision, z, previous):
+    """Builds the AnytimeEstimate for the current running sums, given the
+    one from the batch before (None after the first batch). Each value's
+    interval uses its own effective sample size, p(1 - p) over the
+    delta-method variance of the weighted estimate p: with a single overall
+    effective sample size, a rare value whose few samples carry large
+    weights would look far more certain than it is. It is capped at the
+    overall effective sample size, since the delta method is unreliable when
+    a handful of samples hold most of the weight"""
+    ess = effectiveSampleSize(weightSum, squaredWeightSum)
+    if weightSum > 0.0:
+        probs = [s / weightSum for s in sums]
+    else:
+        probs = [0.0] * len(sums)
+    intervals = []
+    for p, squared in zip(probs, squaredSums):
+        scatter = squared * (1.0 - p) ** 2 + (squaredWeightSum - squared) * p * p
+        if weightSum > 0.0 and scatter > 0.0:
+            n = min(p * (1.0 - p) * weightSum * weightSum / scatter, ess)
+        else:
+            n = ess
+        intervals.append(wilsonInterval(p, n, z))
+    estimate = AnytimeEstimate(compiled.decodeDistribution(queryId, probs),
+                               compiled.decodeDistribution(queryId, intervals),
+                               ess, drawn, accepted, elapsed, False)
+    estimate.converged = (precision is not None and previous is not None and
+                          drawn >= MIN_ANYTIME_SAMPLES and
+                          _precise(estimate, precision) and _precise(previous, precision) and
+                          max(abs(estimate.probs[value] - previous.probs[value])
+                              for value in estimate.probs) <= precision)
+    return estimate
+
+
+def _precise(estimate, precision):
+    """Returns whether one batch's estimate meets the precision on its own"""
+    return estimate.effectiveSamples >= MIN_SAMPLES and estimate.maxWidth() <= precision
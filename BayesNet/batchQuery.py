@@ -0,0 +1,65 @@
+""" Answers many (query node, evidence) pairs at once. Queries that share the
+same evidence are answered together from a single junction-tree calibration,
+and the evidence groups can be spread over a pool of worker processes."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from BayesNet.compiledNet import picklable
+from BayesNet.junctionTree import JunctionTree
+
+
+def groupQueries(queries):
+    """Given a list of (node, evidence dictionary) pairs, groups their
+    positions by evidence. Evidence about the query node itself is left out
+    of the key, since it does not change the answer. Returns a dictionary
+    mapping each frozen set of (node, value) pairs to the list of positions
+    of the queries with that evidence, in order of first appearance"""
+    groups = {}
+    for i, (node, evidence) in enumerate(queries):
+        key = frozenset((n, v) for (n, v) in evidence.items() if n != node)
+        if key not in groups:
+            groups[key] = []
+        groups[key].append(i)
+    return groups
+
+
+def answerGroups(tree, groups):
+    """Given a junction tree and a list of (evidence, node list) pairs, with
+    evidence as a dictionary of node ids to value ids, returns for each
+    group the list of the nodes' posterior distributions. Moving from one
+    group to the next only resends the messages its changed evidence
+    affects."""
+    results = []
+    for (evidence, nodes) in groups:
+        posteriors = tree.posteriors(evidence, nodes)
+        results.append([posteriors[node] for node in nodes])
+    return results
+
+
+def groupWorker(compiled, heuristic, groups):
+    """Runs in a worker process: builds the junction tree for the compiled
+    network and answers a share of the evidence groups"""
+    return answerGroups(JunctionTree(compiled.factors, heuristic), groups)
+
+
+def parallelGroups(compiled, heuristic, groups, numWorkers):
+    """Splits the evidence groups into numWorkers contiguous shares, answers
+    each in its own process, and returns the results in the original
+    order. If the compiled network cannot be pickled, every group is
+    answered in this process instead"""
+    if not picklable(compiled):
+        return groupWorker(compiled, heuristic, groups)
+    numWorkers = min(numWorkers, len(groups))
+    base, extra = divmod(len(groups), numWorkers)
+    shares = []
+    start = 0
+    for i in range(numWorkers):
+        size = base + (1 if i < extra else 0)
+        shares.append(groups[start:start + size])
+        start += size
+    results = []
+    with ProcessPoolExecutor(max_workers=numWorkers) as pool:
+        futures = [pool.submit(groupWorker, compiled, heuristic, share) for share in shares]
+        for future in futures:
+            results.extend(future.result())
+    return results
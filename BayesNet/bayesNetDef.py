@@ -1,6 +1,16 @@
 
 import random
 
+from BayesNet.compiledNet import compileNetwork
+from BayesNet.convergence import intervalsNarrowEnough
+from BayesNet.factors import Factor
+from BayesNet.gibbs import GibbsSampler
+from BayesNet.instrumentation import QueryStats
+from BayesNet.junctionTree import JunctionTree
+from BayesNet.queryCache import QueryCache
+from BayesNet.relevance import cptsSumToOne, prunedNetwork
+from BayesNet.variableElimination import variableElimination
+
 
 class BayesNet:
     """Enables the construction of a Bayesian network. Initially empty, there
@@ -12,24 +22,48 @@ class BayesNet:
     # This first section of methods are used to build the bayesian network
 
 
-    def __init__(self):
-        """Initializes the network to be empty"""
+    def __init__(self, cptBackend = "dict", cacheSize = 128):
+        """Initializes the network to be empty. The CPTs are stored as nested
+        dictionaries unless cptBackend is "tensor", in which case each node's
+        CPT is a NumPy array (see tensorCPT.py), or "sparse", in which case
+        only the entries that differ from a default are stored (see
+        sparseCPT.py). The results of up to
+        cacheSize recent computeProbDist queries are remembered, as are the
+        pruned subnetworks of up to cacheSize recent queries.
+        The node list and the edge lists are dictionaries used as ordered
+        sets (every value is None), so adding or removing a node or edge
+        takes constant time while parents keep the order they were added in,
+        which is the CPT order"""
         self.nodeOrder = []
-        self.nodeList = []
+        self.nodeList = {}
         self.nodeValues = {}
         self.edges = {}
         self.revEdges = {}
         self.cpts = {}
+        self.cptBackend = cptBackend
         self.currentKnowns = {}
+        self.inferenceEngine = "elimination"
+        self.eliminationHeuristic = "min-fill"
+        self.compiled = None
+        self.vectorTables = None
+        self.gibbsSampler = None
+        self.junctionTree = None
+        self.queryCache = QueryCache(cacheSize)
+        self.pruning = True
+        self.prunable = None
+        self.prunedNets = QueryCache(cacheSize)
+        self.stats = QueryStats()
+        self.tracer = None
 
     
     def addNode(self, nodeName, nodeValues):
         """Given a string node name and a list of node values (typically
         strings) this adds the node to the Bayesian Network, with no edges"""
         self.nodeValues[nodeName] = nodeValues
-        self.nodeList.append(nodeName)
-        self.edges[nodeName] = []
-        self.revEdges[nodeName] = []
+        self.nodeList[nodeName] = None
+        self.edges[nodeName] = {}
+        self.revEdges[nodeName] = {}
+        self._networkChanged()
 
     def editNode(self, nodeName, nodeValues):
         """Given a string node name and a list of node values (typically
@@ -37,6 +71,7 @@ class BayesNet:
         this adds it"""
         if nodeName in self.nodeValues:
             self.nodeValues[nodeName] = nodeValues
+            self._networkChanged()
         else:
             self.addNode(nodeName, nodeValues)
             
@@ -45,17 +80,16 @@ class BayesNet:
         including any edges that involved the node"""
         if nodeName in self.nodeValues:
             del self.nodeValues[nodeName]
-            self.nodeList.remove(nodeName)
+            del self.nodeList[nodeName]
             forEdges = self.edges[nodeName]
             backEdges = self.revEdges[nodeName]
             del self.edges[nodeName]
             del self.revEdges[nodeName]
             for neighbor in forEdges:
-                neighEdges = self.revEdges[neighbor]
-                neighEdges.remove(nodeName)
+                del self.revEdges[neighbor][nodeName]
             for neighbor in backEdges:
-                neighEdges = self.edges[neighbor]
-                neighEdges.remove(nodeName)
+                del self.edges[neighbor][nodeName]
+            self._networkChanged()
             
         
         
@@ -68,21 +102,35 @@ class BayesNet:
         elif node2 not in self.nodeValues:
             print("Node does not exist:", node2)
         else:
-            self.edges[node1].append(node2)
-            self.revEdges[node2].append(node1)
+            self.edges[node1][node2] = None
+            self.revEdges[node2][node1] = None
+            self._networkChanged()
 
     def deleteEdge(self, node1, node2):
         """Given two nodes, remove the edge(s) between them"""
         if (node1  in self.nodeValues) and (node2 in self.nodeValues):
             if node1 in self.revEdges[node2]:
-                self.edges[node1].remove(node2)
-                self.revEdges[node2].remove(node1)
+                del self.edges[node1][node2]
+                del self.revEdges[node2][node1]
+                self._networkChanged()
                 
                 
                 
+    def _networkChanged(self):
+        """Called whenever the structure or the CPTs of the network change, so
+        that anything compiled from the old network is thrown away"""
+        self.compiled = None
+        self.vectorTables = None
+        self.gibbsSampler = None
+        self.junctionTree = None
+        self.queryCache.clear()
+        self.prunable = None
+        self.prunedNets.clear()
+
+
     def getNodeNames(self):
         """Return a list of the nodes in the Bayesian Network"""
-        return self.nodeList[:]
+        return list(self.nodeList)
     
     
     def getNodeValues(self, nodeName):
@@ -93,25 +141,45 @@ class BayesNet:
             return []
 
     def getNeighbors(self, nodeName):
-        """For a given node, return a list of the nodes it has an edge TO"""
+        """For a given node, return the nodes it has an edge TO. The result
+        is a read-only view of the network's own edge set, not a copy, so it
+        is cheap to get but changes if the network does"""
         if nodeName in self.edges:
-            return self.edges[nodeName][:]
+            return self.edges[nodeName].keys()
         else:
-            return []
+            return ()
     
     
     def getPredecessors(self, nodeName):
-        """For a given node, return a list of the nodes that have edges to this one"""
+        """For a given node, return the nodes that have edges to this one, in
+        CPT order. Like getNeighbors, this is a read-only view, not a copy"""
         if nodeName in self.revEdges:
-            return self.revEdges[nodeName][:]
+            return self.revEdges[nodeName].keys()
         else:
-            return []
+            return ()
     
     def setupCPTables(self):
         """Given the structure of the network, create a set of Conditional Probability
-        tables."""
-        if self.cpts == {}:
+        tables. Nodes that already have one (such as a parametric CPT set
+        with setNoisyOr) are left alone."""
+        if self.cptBackend == "tensor":
+            from BayesNet.tensorCPT import TensorCPT
             for nodeName in self.nodeOrder:
+                if nodeName in self.cpts:
+                    continue
+                parentValues = [self.nodeValues[p] for p in self.revEdges[nodeName]]
+                self.cpts[nodeName] = TensorCPT(self.nodeValues[nodeName], parentValues)
+        elif self.cptBackend == "sparse":
+            from BayesNet.sparseCPT import SparseCPT
+            for nodeName in self.nodeOrder:
+                if nodeName in self.cpts:
+                    continue
+                parentValues = [self.nodeValues[p] for p in self.revEdges[nodeName]]
+                self.cpts[nodeName] = SparseCPT(self.nodeValues[nodeName], parentValues)
+        else:
+            for nodeName in self.nodeOrder:
+                if nodeName in self.cpts:
+                    continue
                 self.cpts[nodeName] = {}
                 allGivens = self.buildGivens(nodeName)
                 for value in self.nodeValues[nodeName]:
@@ -121,10 +189,106 @@ class BayesNet:
         
         
     def addCPTableValue(self, nodeName, nodeValue, givens, probValue):
-        if type(givens) != tuple:
-            givens = tuple(givens)
-        self.cpts[nodeName][nodeValue][givens] = probValue
-    
+        table = self.cpts[nodeName]
+        if isinstance(table, dict):
+            if type(givens) != tuple:
+                givens = tuple(givens)
+            table[nodeValue][givens] = probValue
+        else:
+            table.setValue(nodeValue, givens, probValue)
+        self._networkChanged()
+
+
+    def setCPTRowDefault(self, nodeName, givens, probValue):
+        """For a node with a sparse CPT, sets the probability of every entry
+        in the row for the given parent values that was not set explicitly"""
+        table = self.cpts[nodeName]
+        if not hasattr(table, "setRowDefault"):
+            raise ValueError("Only a sparse CPT has defaults: " + str(nodeName))
+        table.setRowDefault(givens, probValue)
+        self._networkChanged()
+
+
+    def setCPTDefault(self, nodeName, probValue):
+        """For a node with a sparse CPT, sets the probability of every entry
+        that was not set explicitly, in rows without a default of their own"""
+        table = self.cpts[nodeName]
+        if not hasattr(table, "setDefault"):
+            raise ValueError("Only a sparse CPT has defaults: " + str(nodeName))
+        table.setDefault(probValue)
+        self._networkChanged()
+
+
+    def useCPTBackend(self, cptBackend):
+        """Converts every CPT of the network to the given backend, either
+        "dict" (nested dictionaries), "tensor" (NumPy arrays) or "sparse"
+        (explicit entries plus defaults), and makes it the backend for
+        tables built from now on. Parametric CPTs are left as they are"""
+        if cptBackend not in ("dict", "tensor", "sparse"):
+            raise ValueError("Unknown CPT backend: " + str(cptBackend))
+        self.cptBackend = cptBackend
+        if cptBackend == "tensor":
+            from BayesNet.tensorCPT import tensorFromDict as fromDict
+        elif cptBackend == "sparse":
+            from BayesNet.sparseCPT import sparseFromDict as fromDict
+        for node in self.cpts:
+            table = self.cpts[node]
+            if getattr(table, "parametric", False):
+                continue
+            if not isinstance(table, dict):
+                if table.backend == cptBackend:
+                    continue
+                table = table.toDict()
+            if cptBackend == "dict":
+                self.cpts[node] = table
+            else:
+                parentValues = [self.nodeValues[p] for p in self.revEdges[node]]
+                self.cpts[node] = fromDict(self.nodeValues[node], parentValues, table)
+        self._networkChanged()
+
+
+    def setNoisyOr(self, nodeName, onValue, causes, leak = 0.0):
+        """Makes a two-valued node noisy-OR: causes maps each parent to a
+        dictionary of its values that turn the node to onValue and the
+        probability that each one does, and leak is the probability that
+        the node is on with no cause present. Only the parameters are
+        stored (see parametricCPT.py), not a row per combination of parent
+        values. setupCPTables leaves the node alone if this is called
+        first, so its full table is never built"""
+        from BayesNet.parametricCPT import NoisyOr
+        parents = list(self.revEdges[nodeName])
+        self.cpts[nodeName] = NoisyOr(self.nodeValues[nodeName],
+                                      [self.nodeValues[p] for p in parents], onValue,
+                                      [causes.get(p, {}) for p in parents], leak)
+        self._networkChanged()
+
+
+    def setNoisyMax(self, nodeName, levels, effects, leak = None):
+        """Makes a node noisy-MAX: levels lists the node's values from lowest
+        to highest, and effects maps each parent to a dictionary of its
+        values and, for each, the probability of each level (lowest first)
+        that value alone would cause. The node takes the highest level any
+        cause (or the leak, a list of level probabilities) gives it"""
+        from BayesNet.parametricCPT import NoisyMax
+        parents = list(self.revEdges[nodeName])
+        self.cpts[nodeName] = NoisyMax(self.nodeValues[nodeName],
+                                       [self.nodeValues[p] for p in parents], levels,
+                                       [effects.get(p, {}) for p in parents], leak)
+        self._networkChanged()
+
+
+    def setDeterministic(self, nodeName, function):
+        """Makes a node a fixed function of its parents: function is called
+        with the parents' values, in CPT order, and returns the node's
+        value. Parallel sampling and queryBatch only use several processes
+        if the function can be pickled, so prefer a module-level function to
+        a lambda"""
+        from BayesNet.parametricCPT import Deterministic
+        parents = list(self.revEdges[nodeName])
+        self.cpts[nodeName] = Deterministic(self.nodeValues[nodeName],
+                                            [self.nodeValues[p] for p in parents], function)
+        self._networkChanged()
+
     
         
     # ======================================================================
@@ -137,6 +301,9 @@ class BayesNet:
         if self.nodeOrder == []:
             self.setOrdering()
         self.cpts = oldCPT
+        if self.cptBackend != "dict":
+            self.useCPTBackend(self.cptBackend)
+        self._networkChanged()
             
     def readBayesNet(self, filename):
         """Takes in a filename and reads a description of a Bayesian Network
@@ -158,14 +325,16 @@ class BayesNet:
                 nodeName = lineParts[0]
                 nodeValues = lineParts[1:]
                 self.addNode(nodeName, nodeValues)
-                print("Node", nodeName, nodeValues)
+                if self.tracer is not None:
+                    self.tracer("node", node=nodeName, values=nodeValues)
             elif readMode is None and lowerLine == 'edges':
                 readMode = "Edges"
             elif readMode == "Edges":
                 fromNode = lineParts[0]
                 toNode = lineParts[1]
                 self.addEdge(fromNode, toNode)
-                print("Edge", fromNode, toNode)
+                if self.tracer is not None:
+                    self.tracer("edge", fromNode=fromNode, toNode=toNode)
             elif readMode is None and lowerLine == 'tables':
                 self.setOrdering()
                 self.setupCPTables()
@@ -179,20 +348,75 @@ class BayesNet:
                 givenStr = split1[0][1:]
                 probStr = split1[1]
                 givenBinds = self.equalsToDict(givenStr)
-                print("GivenBinds", givenBinds)
                 givenOrder = self.getPredecessors(cptNode)
                 givenList = []
                 for g in givenOrder:
                     bind = givenBinds[g]
                     givenList.append(bind)
                 probs = self.equalsToDict(probStr)
+                if self.tracer is not None:
+                    self.tracer("cptRow", node=cptNode, givens=givenBinds, probs=probs)
                 for val in probs:
                     prob = float(probs[val])
                     #print("Adding...", cptNode, val, givenList, prob)
                     self.addCPTableValue(cptNode, val, givenList, prob)
         fileObj.close()
+        self._networkChanged()
                 
                 
+    def saveCompiled(self, filename, expand=False):
+        """Writes the compiled network (interned names, topology and CPT
+        arrays) to a binary snapshot file (see snapshot.py), which
+        loadCompiled can read back far faster than readBayesNet can parse
+        the text format. Snapshots hold full tables, so every row of a
+        sparse or parametric CPT is built and stored. A network with one
+        whose full table would be larger than snapshot.MAX_EXPANDED_ENTRIES
+        is only written if expand is True"""
+        from BayesNet.snapshot import writeSnapshot
+        writeSnapshot(self.compile(), filename, expand)
+
+
+    def loadCompiled(self, filename):
+        """Replaces the contents of this network with the one stored in a
+        snapshot file written by saveCompiled. The file is memory-mapped and
+        the CPTs become tensor-backend tables that point straight into it,
+        so loading does no text parsing and no copying of the tables"""
+        from BayesNet.snapshot import readSnapshot
+        from BayesNet.tensorCPT import TensorCPT
+        nodeNames, values, parents, tables = readSnapshot(filename)
+        self.nodeOrder = nodeNames[:]
+        self.nodeList = dict.fromkeys(nodeNames)
+        self.nodeValues = {}
+        self.edges = {}
+        self.revEdges = {}
+        self.cpts = {}
+        self.cptBackend = "tensor"
+        for node, name in enumerate(nodeNames):
+            self.nodeValues[name] = values[node]
+            self.edges[name] = {}
+            self.revEdges[name] = dict.fromkeys(nodeNames[p] for p in parents[node])
+            for p in parents[node]:
+                self.edges[nodeNames[p]][name] = None
+            parentValues = [values[p] for p in parents[node]]
+            self.cpts[name] = TensorCPT(values[node], parentValues, tables[node])
+        self._networkChanged()
+
+
+    def readBif(self, filename):
+        """Takes in the name of a file in the standard BIF format (the one
+        used by the usual benchmark networks) and reads it into this network.
+        The file is streamed token by token and the CPTs are written straight
+        into tensor-backend tables (see bifReader.py)"""
+        from BayesNet.bifReader import readBif
+        readBif(self, filename)
+
+
+    def readXmlBif(self, filename):
+        """Like readBif, but for files in the XMLBIF format"""
+        from BayesNet.bifReader import readXmlBif
+        readXmlBif(self, filename)
+
+
     def equalsToDict(self, strOfEqs):
         """Given a string of the form "x1 = y1 x2 = y2 ..." break it up and 
         build a dictionary with x's as keys and y's as values."""
@@ -222,7 +446,7 @@ class BayesNet:
             print("Entering probabilities for the CPT for node", node)
 
             self.cpts[node] = {}
-            inNodes = self.revEdges[node]
+            inNodes = list(self.revEdges[node])
             allGivens = self.recGivensBuild(inNodes, 0)
             for givens in allGivens:
                 numVals = len(self.nodeValues[node])
@@ -248,13 +472,16 @@ class BayesNet:
                     print("Adding table value:", node, value, givens, self.cpts[node][value][tuple(givens)])
                     cnt += 1
                 print()
+        if self.cptBackend != "dict":
+            self.useCPTBackend(self.cptBackend)
+        self._networkChanged()
 
 
 
     def buildGivens(self, nodeName):
         """Given the name of a node, it builds a list of lists that contains all the possible combinations of values from incoming edges"""
         if nodeName in self.nodeValues:
-            return self.recGivensBuild(self.revEdges[nodeName], 0)
+            return self.recGivensBuild(list(self.revEdges[nodeName]), 0)
         
         
     def recGivensBuild(self, inEdges, pos):
@@ -279,21 +506,26 @@ class BayesNet:
     def setOrdering(self):
         """This function takes the set of nodes, and orders them in
         topological order, so that nodes with no parents come first, and then
-        nodes that depend only on previously added nodes"""
+        nodes that depend only on previously added nodes. Each node is added
+        once its count of parents not yet ordered drops to zero, so this takes
+        time linear in the size of the network. Raises ValueError if the
+        edges form a cycle"""
         self.nodeOrder = []
-        nodesNotIn = self.nodeList[:]
-        while nodesNotIn != []:
-            nextNode = nodesNotIn[0]
-            nodesNotIn.pop(0)
-            allGivensIn = True
-            for hidden in self.revEdges[nextNode]:
-                if hidden not in self.nodeOrder:
-                    allGivensIn = False
-                    break
-            if allGivensIn:
-                self.nodeOrder.append(nextNode)
-            else:
-                nodesNotIn.append(nextNode)
+        waitingOn = {}
+        for node in self.nodeList:
+            waitingOn[node] = len(self.revEdges[node])
+            if waitingOn[node] == 0:
+                self.nodeOrder.append(node)
+        pos = 0
+        while pos < len(self.nodeOrder):
+            for child in self.edges[self.nodeOrder[pos]]:
+                waitingOn[child] -= 1
+                if waitingOn[child] == 0:
+                    self.nodeOrder.append(child)
+            pos += 1
+        if len(self.nodeOrder) != len(self.nodeList):
+            cycle = [node for node in self.nodeList if waitingOn[node] > 0]
+            raise ValueError("Network has a cycle through: " + " ".join(cycle))
 
 
 
@@ -318,6 +550,30 @@ class BayesNet:
     def resetKnowns(self):
         """Removes all knowns"""
         self.currentKnowns = {}
+
+
+    def currentMarginal(self, nodeName):
+        """Returns the probability distribution of the given node given
+        self.currentKnowns, as a dictionary. This is read from the compiled
+        junction tree, which remembers its messages between calls: after
+        adding, changing or deleting one known, only the messages affected by
+        that known are recomputed"""
+        compiled = self.compile()
+        tree = self.compileJunctionTree()
+        tree.updateEvidence(compiled.encodeEvidence(self.currentKnowns))
+        node = compiled.nodeId[nodeName]
+        return compiled.decodeDistribution(node, tree.marginal(node))
+
+
+    def currentMarginals(self):
+        """Returns a dictionary mapping every node to its probability
+        distribution given self.currentKnowns, updated incrementally in the
+        same way as currentMarginal"""
+        compiled = self.compile()
+        tree = self.compileJunctionTree()
+        tree.updateEvidence(compiled.encodeEvidence(self.currentKnowns))
+        return {name: compiled.decodeDistribution(node, tree.marginal(node))
+                for node, name in enumerate(compiled.nodeNames)}
         
         
     def askProbs(self):
@@ -362,30 +618,306 @@ class BayesNet:
     # ----- is not a list of lists, but a dictionary with the node names as
     # ----- the keys, and the values as the values
 
-    def computeProbDist(self, node, knowns):
+    def computeProbDist(self, node, knowns, engine = None):
         """Given a node, this uses the set of known values for nodes stored
         in self.currentKnowns, where the keys are the nodes and the values
         are the values, this function computes the probability distribution
         _P_(node | knownDict). The probability distribution is represented as
         a dictionary, where the keys are the values node can take on, and the
-        value is the conditional probability of that value"""
-        probDist = {}
-        for value in self.nodeValues[node]:
-            newKnowns = knowns.copy()   #self.currentKnowns.copy()
-            newKnowns[node] = value
-            probDist[value] = self.computeProbabilities(newKnowns)
+        value is the conditional probability of that value. The engine may be
+        "elimination", "junction-tree" or "enumeration"; if it is not given,
+        then this uses self.inferenceEngine. The engine runs on the part of
+        the network relevant to the query (see relevantNetwork). Results are
+        cached until the network changes, so asking the same question again
+        is a lookup"""
+        start = self.stats.startQuery()
+        cacheKey = self.queryCache.makeKey(node, knowns)
+        cached = self.queryCache.lookup(cacheKey)
+        if cached is not None:
+            self.stats.endQuery(start)
+            return cached.copy()
+        if engine is None:
+            engine = self.inferenceEngine
+        network, relevantKnowns = self.relevantNetwork(node, knowns)
+        probDist = network._inferProbDist(node, relevantKnowns, engine)
+        self.queryCache.store(cacheKey, probDist.copy())
+        self.stats.endQuery(start)
+        return probDist
+
+
+    def _inferProbDist(self, node, knowns, engine):
+        """Runs the given engine to compute the normalized distribution
+        P(node | knowns) on this network, with no caching or pruning"""
+        if engine == "elimination":
+            compiled = self.compile()
+            nodeId = compiled.nodeId[node]
+            evidence = compiled.encodeEvidence(knowns)
+            evidence.pop(nodeId, None)
+            result = variableElimination(compiled.factors, [nodeId], evidence,
+                                         self.eliminationHeuristic)
+            probDist = compiled.decodeDistribution(nodeId, result.table)
+        elif engine == "junction-tree":
+            compiled = self.compile()
+            tree = self.compileJunctionTree()
+            nodeId = compiled.nodeId[node]
+            evidence = compiled.encodeEvidence(knowns)
+            evidence.pop(nodeId, None)
+            tree.calibrate(evidence)
+            probDist = compiled.decodeDistribution(nodeId, tree.marginal(nodeId))
+        elif engine == "enumeration":
+            probDist = {}
+            for value in self.nodeValues[node]:
+                newKnowns = knowns.copy()   #self.currentKnowns.copy()
+                newKnowns[node] = value
+                probDist[value] = self.recComputProb(self.nodeOrder, 0, newKnowns, 0)
+        else:
+            raise ValueError("Unknown inference engine: " + str(engine))
         self.normalize(probDist)
         return probDist
 
+
+    def relevantNetwork(self, query, evidence):
+        """Given a query node (or None when the query is the probability of
+        the evidence) and a dictionary of evidence, returns the smallest
+        network that gives the same answer, along with the evidence that
+        falls inside it. Barren nodes and nodes d-separated from the query
+        are pruned away (see relevance.py). Pruned networks are cached for
+        each query node and set of evidence nodes, so one built for a query
+        is reused whatever the evidence values are. Pruning is only sound if
+        every CPT row sums to one, so a network with a row that does not is
+        never pruned (with a warning the first time). If pruning is off,
+        cannot be used, or removes nothing, this returns the network itself"""
+        if not self.pruning:
+            return self, evidence
+        if self.prunable is None:
+            self.prunable = cptsSumToOne(self)
+            if not self.prunable:
+                print("WARNING: some CPT rows do not sum to 1, so queries will not be pruned")
+        if not self.prunable:
+            return self, evidence
+        evidenceVars = frozenset(n for n in evidence if n != query)
+        key = (query, evidenceVars)
+        network = self.prunedNets.lookup(key)
+        if network is None:
+            network = prunedNetwork(self, query, evidenceVars)
+            if len(network.nodeList) == len(self.nodeList):
+                network = self
+            self.prunedNets.store(key, network)
+        if network is self:
+            return self, evidence
+        network.inferenceEngine = self.inferenceEngine
+        network.eliminationHeuristic = self.eliminationHeuristic
+        network.stats = self.stats
+        network.tracer = self.tracer
+        relevant = {n: evidence[n] for n in evidence if n in network.nodeValues}
+        return network, relevant
+
+
+    def allMarginals(self, evidenceDict = None):
+        """Given a dictionary of evidence (self.currentKnowns if it is not
+        given), returns a dictionary mapping every node without evidence to
+        its probability distribution given the evidence. Rather than one
+        query per node, this makes one collect-and-distribute sweep over the
+        compiled junction tree and reads every posterior off the calibrated
+        cliques. The answers also go into the query cache"""
+        if evidenceDict is None:
+            evidenceDict = self.currentKnowns.copy()
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        evidence = compiled.encodeEvidence(evidenceDict)
+        nodes = [node for node in range(len(compiled)) if node not in evidence]
+        posteriors = self.compileJunctionTree().posteriors(evidence, nodes)
+        marginals = {}
+        for node in posteriors:
+            name = compiled.nodeNames[node]
+            probDist = compiled.decodeDistribution(node, posteriors[node])
+            self.queryCache.store(self.queryCache.makeKey(name, evidenceDict), probDist.copy())
+            marginals[name] = probDist
+        self.stats.endQuery(start)
+        return marginals
+
+
+    def queryBatch(self, queries, numWorkers = None):
+        """Takes a list of (node, evidence dictionary) pairs and returns the
+        list of their probability distributions, in the same order, as
+        computeProbDist would. The queries are grouped by their evidence,
+        and each group is answered from a single calibration of the
+        network's junction tree (see batchQuery.py); moving between groups
+        only resends the messages whose evidence changed. Queries already in
+        the query cache are not recomputed. If numWorkers is more than one,
+        the evidence groups are split across that many worker processes,
+        each of which builds its own junction tree"""
+        from BayesNet.batchQuery import answerGroups, groupQueries, parallelGroups
+        start = self.stats.startQuery()
+        results = [None] * len(queries)
+        cacheKeys = [self.queryCache.makeKey(node, evidence) for (node, evidence) in queries]
+        pending = []
+        for i in range(len(queries)):
+            cached = self.queryCache.lookup(cacheKeys[i])
+            if cached is None:
+                pending.append(i)
+            else:
+                results[i] = cached.copy()
+        compiled = self.compile()
+        grouped = groupQueries([queries[i] for i in pending])
+        groups = []
+        positions = []
+        for key in grouped:
+            groups.append((compiled.encodeEvidence(dict(key)),
+                           [compiled.nodeId[queries[pending[j]][0]] for j in grouped[key]]))
+            positions.append([pending[j] for j in grouped[key]])
+        if numWorkers is not None and numWorkers > 1 and len(groups) > 1:
+            answers = parallelGroups(compiled, self.eliminationHeuristic, groups, numWorkers)
+        else:
+            answers = answerGroups(self.compileJunctionTree(), groups)
+        for (groupPositions, groupAnswers) in zip(positions, answers):
+            for (i, probs) in zip(groupPositions, groupAnswers):
+                node = queries[i][0]
+                probDist = compiled.decodeDistribution(compiled.nodeId[node], probs)
+                self.queryCache.store(cacheKeys[i], probDist.copy())
+                results[i] = probDist
+        self.stats.endQuery(start)
+        return results
+
+
+    def queryCacheStats(self):
+        """Returns the hit and miss statistics of the query cache"""
+        return self.queryCache.stats()
+
+
+    def getStats(self):
+        """Returns the QueryStats object holding the network's counters (see
+        instrumentation.py)"""
+        return self.stats
+
+
+    def resetStats(self):
+        """Sets all of the network's counters back to zero"""
+        self.stats.reset()
+
+
+    def setTracer(self, tracer):
+        """Installs a tracer function, called as tracer(event, **details) as
+        the network is read and as enumeration runs (see
+        instrumentation.py for the events). Passing None turns tracing off"""
+        self.tracer = tracer
+
     
-    def computeProbabilities(self, knownDict = None):
+    def computeProbabilities(self, knownDict = None, engine = None):
         """Given a dictionary of known values for nodes, this function
         computes the probability of that conjunction of factors taking place.
-        The work is actually done by a recursive helper function If no
-        dictionary is passed in, then this uses self.currentKnowns"""
+        With the enumeration engine the work is actually done by a recursive
+        helper function, while the elimination engine sums every other node
+        out of the network's factors. If no dictionary is passed in, then this
+        uses self.currentKnowns"""
         if knownDict is None:
             knownDict = self.currentKnowns.copy()
-        return self.recComputProb(self.nodeOrder, 0, knownDict, 0)
+        if engine is None:
+            engine = self.inferenceEngine
+        start = self.stats.startQuery()
+        network, knownDict = self.relevantNetwork(None, knownDict)
+        if engine == "elimination":
+            compiled = network.compile()
+            result = variableElimination(compiled.factors, [],
+                                         compiled.encodeEvidence(knownDict),
+                                         self.eliminationHeuristic)
+            prob = result.table[0]
+        elif engine == "junction-tree":
+            tree = network.compileJunctionTree()
+            tree.calibrate(network.compile().encodeEvidence(knownDict))
+            prob = tree.evidenceProbability()
+        elif engine == "enumeration":
+            prob = network.recComputProb(network.nodeOrder, 0, knownDict, 0)
+        else:
+            raise ValueError("Unknown inference engine: " + str(engine))
+        self.stats.endQuery(start)
+        return prob
+
+
+    def mostProbableExplanation(self, evidenceDict = None, k = None):
+        """Given a dictionary of evidence (self.currentKnowns if it is not
+        given), finds the most probable assignment of values to all of the
+        other nodes, by max-product variable elimination (see maxProduct.py).
+        Returns a pair of a dictionary of node values and the joint
+        probability of that assignment with the evidence, or None if the
+        evidence is impossible. If k is given, this instead returns a list of
+        up to k such pairs, best first"""
+        if evidenceDict is None:
+            evidenceDict = self.currentKnowns.copy()
+        return self.maximumAPosteriori(list(self.nodeList), evidenceDict, k)
+
+
+    def maximumAPosteriori(self, mapNodes, evidenceDict, k = None):
+        """Given a list of nodes and a dictionary of evidence, finds the most
+        probable assignment of values to just those nodes, summing over all
+        of the others (a partial MAP query). The other nodes are summed out
+        first and the MAP nodes are then maxed out, keeping the tables needed
+        to trace back the best values. Returns a pair of a dictionary of
+        node values and the joint probability of those values with the
+        evidence, or None if the evidence is impossible. If k is given, this
+        instead returns a list of up to k such pairs, best first"""
+        from BayesNet.maxProduct import maxProduct, topMaxProduct
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        evidence = compiled.encodeEvidence(evidenceDict)
+        mapIds = [compiled.nodeId[node] for node in mapNodes]
+        if k is None:
+            results = [maxProduct(compiled.factors, mapIds, evidence, self.eliminationHeuristic)]
+            if results[0] is None:
+                results = []
+        else:
+            results = topMaxProduct(compiled.factors, mapIds, evidence, k, self.eliminationHeuristic)
+        self.stats.endQuery(start)
+        decoded = []
+        for (assignment, prob) in results:
+            values = {compiled.nodeNames[node]: compiled.values[node][v]
+                      for node, v in assignment.items()}
+            decoded.append(({node: values[node] for node in mapNodes if node in values}, prob))
+        if k is not None:
+            return decoded
+        if decoded == []:
+            print("ERROR: the evidence is impossible, there is no most probable assignment")
+            return None
+        return decoded[0]
+
+
+    def compile(self):
+        """Builds the integer-compiled form of the network (see
+        compiledNet.py), in which nodes and values are interned to dense
+        ids and the CPTs are flat lists. The fast inference and sampling
+        paths all work on it. It is kept until the network changes"""
+        if self.compiled is None:
+            self.setOrdering()
+            self.compiled = compileNetwork(self)
+        return self.compiled
+
+
+    def compileJunctionTree(self, heuristic = None):
+        """Builds a junction tree from the network's compiled CPTs, so that
+        repeated queries only need to pass messages. The tree's variables are
+        the compiled node ids. It is kept until the network changes, so
+        calling this again is cheap"""
+        if self.junctionTree is None:
+            if heuristic is None:
+                heuristic = self.eliminationHeuristic
+            self.junctionTree = JunctionTree(self.compile().factors, heuristic)
+        return self.junctionTree
+
+
+    def nodeFactor(self, node):
+        """Builds the factor for a node's CPT. Its variables are the node's
+        parents, in CPT order, followed by the node itself, so each block of
+        consecutive entries is one row of the CPT"""
+        variables = list(self.revEdges[node]) + [node]
+        cards = [len(self.nodeValues[var]) for var in variables]
+        if not isinstance(self.cpts[node], dict):
+            return Factor(variables, cards, self.cpts[node].flatTable())
+        table = []
+        for givens in self.buildGivens(node):
+            givens = tuple(givens)
+            for value in self.nodeValues[node]:
+                table.append(self.cpts[node][value][givens])
+        return Factor(variables, cards, table)
 
 
     def recComputProb(self, nodes, pos, knownDict, indent = 0):
@@ -395,36 +927,41 @@ class BayesNet:
         probability of those knowns. When it reaches a variable where the
         value is not known, it compute separate probabilities for each
         possible value of the variable, and then adds them up. The indent
-        argument just allows this function to print out what it is doing in
-        such a way that the recursion is clear: the deeper the recursion, the
-        greater the indent"""
+        argument is the depth of the recursion, which is passed to the
+        tracer (if one is installed) so that it can show what this function
+        is doing in such a way that the recursion is clear"""
+        self.stats.recursionNodes += 1
         if pos == len(nodes):
             return 1.0
         else:
             nextNode = nodes[pos]
-            print("   " * indent, "Looking at node", nextNode)
+            tracer = self.tracer
+            if tracer is not None:
+                tracer("visit", node=nextNode, depth=indent)
             knownValue = self.findValue(nextNode, knownDict)
             if knownValue != None:
-                print("   " * indent, "...Value known:", knownValue)
-                print("   " * indent, knownDict)
                 currProb = self.lookupCPT(nextNode, knownValue, knownDict)
-                print("   " * indent, "  Multiplying by probability:", currProb)
+                if tracer is not None:
+                    tracer("known", node=nextNode, value=knownValue, prob=currProb, depth=indent)
+                if currProb == 0.0:
+                    # Nothing below a zero-probability entry can count
+                    return 0.0
                 rest = self.recComputProb(nodes, pos+1, knownDict, indent+1)
-                print("   " * indent, currProb, "has type", type(currProb), rest, "has type", type(rest))
                 return currProb * rest
             else:
-                print("   " * indent, "...Unknown, summing!=================")
                 sumProb = 0
                 for val in self.nodeValues[nextNode]:
-                    print("   " * indent, nextNode, "...Next value =", val)
+                    currProb = self.lookupCPT(nextNode, val, knownDict)
+                    if tracer is not None:
+                        tracer("branch", node=nextNode, value=val, prob=currProb, depth=indent)
+                    if currProb == 0.0:
+                        continue
                     newKnowns = knownDict.copy()
-                    #print("   " * indent, "  newKnowns =", newKnowns)
                     newKnowns[nextNode] = val
-                    currProb = self.lookupCPT(nextNode, val, knownDict)
-                    print("   " * indent, "  Multiplying by probability:", currProb)
                     rest = self.recComputProb(nodes, pos + 1, newKnowns, indent + 1)
                     sumProb += currProb * rest
-                print("   " * indent, "=====================================")
+                if tracer is not None:
+                    tracer("sumDone", node=nextNode, prob=sumProb, depth=indent)
                 return sumProb
 
 
@@ -432,6 +969,14 @@ class BayesNet:
         """Given a node, its value, and the dictionary of known variables and
         values, this function looks up the correct entry in the CPT"""
         #print("Look up:", node, value, knownDict)
+        self.stats.cptLookups += 1
+        table = self.cpts[node]
+        if not isinstance(table, dict):
+            prob = table.lookupKnowns(self.revEdges[node], value, knownDict)
+            if prob is None:
+                print("UH-OH: a missing value!", node, knownDict)
+                return 0.0
+            return prob
         givens = []
         for parent in self.revEdges[node]:
             val = self.findValue(parent, knownDict)
@@ -487,18 +1032,41 @@ class BayesNet:
     # -----------------------------
     # MCMC, Gibbs Sampling
     
-    def gibbsSampling(self, queryNode, evidenceDict, numSteps):
+    def gibbsSampling(self, queryNode, evidenceDict, numSteps, burnIn = 0, thin = 1, numChains = 1, seed = None):
         """Performs Gibbs sampling on the network. Generates an initial random set of values, fixing the evidence
         values. Then it moves about in the state space of possible events, changing one non-evidence value at a time
         (including possibly staying in the same state). It changes the value based on a probability distribution of
         values for that node, given the Markov Blanket of the node (parents, children, and children's parents).
         It repeats this N times the number of non-evidence variables, counting the frequency of each possible query
-        value in the process. Finally, it normalizes the counts to be probabilities that sum to 1.0, and returns it."""
-        # Get samples by walk
-        pass   #TODO: Define this method, in conjunction with the three methods below to implement the Gibbs sampling algorithm
+        value in the process. Finally, it normalizes the counts to be probabilities that sum to 1.0, and returns it.
+        Each of the numChains independent chains first makes burnIn sweeps that are not counted, and then counts
+        the state after every thin-th of its numSteps sweeps. The seed makes the result reproducible."""
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.gibbsSampling(queryNode, evidenceDict, numSteps, burnIn, thin, numChains, seed)
+        start = self.stats.startQuery()
         # Get samples by walk
+        sampler = self.compileGibbsSampler()
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        rand = random.Random(seed).random
         # Set up count of each queryNode outcome
+        counts = sampler.queryCounts(queryId, compiled.encodeEvidence(evidenceDict), numSteps,
+                                     burnIn, thin, numChains, rand)
+        self.stats.samplesDrawn += sum(counts)
         # Turn counts into probabilities
+        probs = compiled.decodeDistribution(queryId, counts)
+        self.normalize(probs)
+        self.stats.endQuery(start)
+        return probs
+
+
+    def compileGibbsSampler(self):
+        """Builds (once per version of the network) the Gibbs sampler for the
+        compiled network, with each node's Markov blanket precomputed"""
+        if self.gibbsSampler is None:
+            self.gibbsSampler = GibbsSampler(self.compile())
+        return self.gibbsSampler
 
         
     def gibbsGetSamples(self, evidenceDict, numBigSteps):
@@ -506,13 +1074,29 @@ class BayesNet:
         is a dictionary where the key is the random variable and the value is the assigned value for that variable.
         Each big step iterates through a sequence of samples, one for each non-evidence node in the network. Returns a list
         of all samples visited in the walk."""
-        pass  # TODO: Define this method, in conjunction with the other three methods to implement the Gibbs sampling algorithm
+        samples = []
+        currEvent = self.randomAssign(evidenceDict)
+        nonEvidence = [node for node in self.nodeOrder if node not in evidenceDict]
+        for step in range(numBigSteps):
+            for node in nonEvidence:
+                probs = self.markovBlanketProbs(node, currEvent)
+                values = list(probs.keys())
+                currEvent = currEvent.copy()
+                currEvent[node] = self.weightedSelection(values, [probs[v] for v in values])
+                samples.append(currEvent)
+        return samples
 
 
     def randomAssign(self, evidence):
         """Creates a new event by randomly assigning values to those nodes that don't have them fixed by the evidence.
         This random assignment is done without respect to probabilities. Returns the sample (a dictionary as described above)."""
-        pass  # TODO: Define this method, in conjunction with the other three methods to implement the Gibbs sampling algorithm
+        event = {}
+        for node in self.nodeOrder:
+            if node in evidence:
+                event[node] = evidence[node]
+            else:
+                event[node] = random.choice(self.nodeValues[node])
+        return event
     
 
     def markovBlanketProbs(self, node, currEvent):
@@ -524,34 +1108,120 @@ class BayesNet:
         children's probabilities.
         Returns the computed probability distribution, a dictionary where the keys are values and the values are the probabilities, which
         must sum to 1.0"""
-        pass  # TODO: Define this method, in conjunction with the other three methods to implement the Gibbs sampling algorithm
+        probs = {}
+        event = currEvent.copy()
+        for value in self.nodeValues[node]:
+            event[node] = value
+            prob = self.lookupCPT(node, value, event)
+            for child in self.edges[node]:
+                prob *= self.lookupCPT(child, event[child], event)
+            probs[value] = prob
+        total = sum(probs.values())
+        if total == 0.0:
+            # An impossible event: fall back on a uniform distribution
+            for value in probs:
+                probs[value] = 1.0 / len(probs)
+        else:
+            self.normalize(probs)
+        return probs
 
 
     # ----------------------------------------------------
     # Likelihood weighting
     
-    def likelihoodWeighting(self, queryNode, evidenceDict, numSamples):
+    def likelihoodWeighting(self, queryNode, evidenceDict, numSamples, vectorized = False, seed = None):
         """Takes in a query node, a dictionary of evidence, and the number
         of samples to compute, and it generates that many weighted samples,
         where the evidence is fixed, and it uses the weights to compute
         the probability distribution.  Returns the probability distribution (a dictionary with values of query variable
-        for keys and probabilities for values."""
+        for keys and probabilities for values.
+        The same seed always gives the same result. If vectorized is True,
+        the samples are generated in batch with NumPy (see vectorSampling.py)
+        and their weights are kept as logs"""
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.likelihoodWeighting(queryNode, evidenceDict, numSamples, vectorized, seed)
+        start = self.stats.startQuery()
+        self.stats.samplesDrawn += numSamples
+        if vectorized:
+            weightSums = self._vectorLikelihoodWeighting(queryNode, evidenceDict, numSamples, seed)
+            self.stats.endQuery(start)
+            return weightSums
         # get samples
         # set up total weights for each value of query node
         # add sample's weight to appropriate query node value
         # convert to probability distribution
-        weightSums = {}
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        evidence = compiled.encodeEvidence(evidenceDict)
+        rand = random.Random(seed).random
+        totals = [0.0] * compiled.cards[queryId]
         for i in range(numSamples):
-            samp, weight = self.weightedSample(evidenceDict)
-            v = samp[queryNode]
-            if (v not in weightSums):
-                weightSums[v] = weight
-            else:
-                weightSums[v] += weight
+            samp, weight = compiled.weightedSample(evidence, rand)
+            totals[samp[queryId]] += weight
+        weightSums = compiled.decodeDistribution(queryId, totals)
         self.normalize(weightSums)
+        self.stats.endQuery(start)
         return weightSums
 
 
+    def _vectorLikelihoodWeighting(self, queryNode, evidenceDict, numSamples, seed):
+        """The batched form of likelihoodWeighting: all samples are drawn
+        column by column, and the posterior comes from one weighted bincount
+        over the query node's column"""
+        from BayesNet.vectorSampling import likelihoodWeightColumns, weightedDistribution
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        samples, logWeights = likelihoodWeightColumns(self.compileVectorTables(),
+                                                      compiled.encodeEvidence(evidenceDict),
+                                                      numSamples, seed)
+        probs = weightedDistribution(samples, logWeights, queryId)
+        if probs is None:
+            print("ERROR: every sample had zero weight, the evidence may be impossible")
+            return None
+        return compiled.decodeDistribution(queryId, probs)
+
+
+    def adaptiveImportanceSampling(self, queryNode, evidenceDict, numSamples, rounds = 10,
+                                   samplesPerRound = 1000, seed = None):
+        """Estimates P(queryNode | evidence) by adaptive importance sampling
+        (AIS-BN, see importanceSampling.py). Where likelihood weighting draws
+        every node from its CPT, this first spends rounds rounds of
+        samplesPerRound samples learning an importance function that draws
+        the evidence nodes' ancestors roughly from their posterior, and then
+        draws numSamples weighted samples from it. With unlikely evidence
+        the weights are far more even, so far fewer samples are needed for
+        the same accuracy. The effective sample size of the final samples is
+        left in self.stats.lastEffectiveSamples, and each learning round is
+        passed to the tracer as an "importance" event. Returns the
+        probability distribution, or None if every sample had zero weight"""
+        from BayesNet.importanceSampling import adaptiveImportanceSample
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.adaptiveImportanceSampling(queryNode, evidenceDict, numSamples,
+                                                      rounds, samplesPerRound, seed)
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        tracer = self.tracer
+
+        def roundDone(k, ess):
+            if tracer is not None:
+                tracer("importance", node=queryNode, round=k, effectiveSamples=ess,
+                       samplesDrawn=samplesPerRound)
+
+        probs, ess, drawn = adaptiveImportanceSample(compiled, compiled.nodeId[queryNode],
+                                                     compiled.encodeEvidence(evidenceDict), numSamples,
+                                                     rounds, samplesPerRound, random.Random(seed).random,
+                                                     roundDone)
+        self.stats.samplesDrawn += drawn
+        self.stats.lastEffectiveSamples = ess
+        self.stats.endQuery(start)
+        if probs is None:
+            print("ERROR: every sample had zero weight, the evidence may be impossible")
+            return None
+        return compiled.decodeDistribution(compiled.nodeId[queryNode], probs)
+
+
     def likelihoodWeightingSamples(self, evidenceDict, numSamples):
         """Build a list of samples paired with their weights, given a dictionary of evidence and the number
         of samples to build. Returns the list of tuples. Each tuple contains a sample (each sample is a dictionary with
@@ -562,53 +1232,60 @@ class BayesNet:
     def weightedSample(self, evidence):
         """Takes in a dictionary of evidence, and fills it out to be a full event by randomly selecting for those nodes
         not specified. It returns a tuple of the event/sample and a weight that is the product of the probabilities of
-        the evidence nodes."""
-        w = 1.0
-        sample = {}
-        knowns = {}
-        for node in self.nodeOrder:
-            if (node not in evidence):
-                sampVal = self.sampleNode(node, knowns)
-                knowns[node] = sampVal
-                sample[node] = sampVal
-            elif (node in evidence):
-                sample[node] = evidence[node]
-                probRow = {}
-                probs = []
-                values = self.getNodeValues(node)
-                for nodeVal in values:
-                    nextProb = self.lookupCPT(node, nodeVal, knowns)
-                    probRow[nodeVal] = nextProb
-                    probs.append(nextProb)
-                knowns[node] = self.weightedSelection(values, probs)
-                p = probRow[evidence[node]]
-                w = w * p
-        return sample, w
+        the evidence nodes. The work is done on the compiled network, and
+        only the finished sample is turned back into a dictionary."""
+        self.stats.samplesDrawn += 1
+        compiled = self.compile()
+        assignment, w = compiled.weightedSample(compiled.encodeEvidence(evidence))
+        return compiled.decodeAssignment(assignment), w
 
 
     
     # -----------------------------
     # Rejection sampling
     
-    def rejectionSampling(self, queryNode, evidenceDict, numSamples):
+    def rejectionSampling(self, queryNode, evidenceDict, numSamples, targetAccepted = None, ciWidth = None, seed = None):
         """Takes in a query variable, a dictionary of known values, and the 
         number of samples to generate, and it estimates the probability
-        distribution P(Q | e) using the samples."""
-        samples = self.priorSampling(numSamples)
-        matchingSamples = self.selectConsistent(samples, evidenceDict)
-        if len(matchingSamples) == 0:
+        distribution P(Q | e) using the samples. Samples are streamed one at
+        a time: each one is abandoned as soon as an evidence node disagrees
+        with the evidence, nodes after the last one that matters are never
+        sampled, and only the counts of the query's values are kept, so the
+        memory used does not grow with numSamples. Sampling stops early once
+        targetAccepted samples have matched the evidence, or once every
+        value's 95% confidence interval is at most ciWidth wide. The seed
+        makes the result reproducible"""
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.rejectionSampling(queryNode, evidenceDict, numSamples,
+                                             targetAccepted, ciWidth, seed)
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        evidence = compiled.encodeEvidence(evidenceDict)
+        numNodes = max(list(evidence) + [queryId]) + 1
+        rand = random.Random(seed).random
+        assignment = [0] * len(compiled)
+        counts = [0] * compiled.cards[queryId]
+        accepted = 0
+        drawn = 0
+        while drawn < numSamples:
+            drawn += 1
+            if not compiled.rejectionSample(evidence, assignment, rand, numNodes):
+                continue
+            counts[assignment[queryId]] += 1
+            accepted += 1
+            if targetAccepted is not None and accepted >= targetAccepted:
+                break
+            if ciWidth is not None and intervalsNarrowEnough(counts, accepted, ciWidth):
+                break
+        self.stats.samplesDrawn += drawn
+        self.stats.rejections += drawn - accepted
+        self.stats.endQuery(start)
+        if accepted == 0:
             print("No samples found, try again and increase number of samples")
             return None
-        nodeValues = self.getNodeValues(queryNode)
-        countValues = {}
-        for val in nodeValues:
-            countValues[val] = 0
-        for inst in matchingSamples:
-            instVal = inst[queryNode]
-            countValues[instVal] += 1
-        probs = {}
-        for val in nodeValues:
-            probs[val] = countValues[val] / len(matchingSamples)
+        probs = compiled.decodeDistribution(queryId, counts)
         self.normalize(probs)
         return probs
         
@@ -638,30 +1315,160 @@ class BayesNet:
         weighted sampling of the current node's values given those
         previously-generated values. In the end it generates numSamples
         different instances of exam situations, and returns them as a list
-        of dictionaries."""
+        of dictionaries. The sampling itself runs on the compiled network,
+        using integer ids throughout."""
+        self.stats.samplesDrawn += numSamples
+        compiled = self.compile()
         samples = []
         for i in range(numSamples):
-            knowns = {}
-            for node in self.nodeOrder:
-                sampVal = self.sampleNode(node, knowns)
-                knowns[node] = sampVal
-            samples.append(knowns)
+            samples.append(compiled.decodeAssignment(compiled.sample()))
         return samples
+
+
+    def priorSamplingColumns(self, numSamples, seed = None):
+        """A vectorized version of priorSampling for large sample counts. It
+        draws the whole column of samples for one node at a time with NumPy,
+        and returns a columnar SampleSet (see vectorSampling.py) holding one
+        array of value ids per node, rather than a list of dictionaries. The
+        seed makes the samples reproducible"""
+        from BayesNet.vectorSampling import priorSampleColumns
+        self.stats.samplesDrawn += numSamples
+        return priorSampleColumns(self.compileVectorTables(), numSamples, seed)
+
+
+    def compileVectorTables(self):
+        """Builds (once per version of the network) the array form of the
+        compiled CPTs used by the vectorized samplers"""
+        if self.vectorTables is None:
+            from BayesNet.vectorSampling import VectorTables
+            self.vectorTables = VectorTables(self.compile())
+        return self.vectorTables
+
+
+    # -----------------------------
+    # Parallel sampling
+
+    def parallelPriorCounts(self, numSamples, numWorkers = None, seed = None):
+        """Draws numSamples prior samples spread over a pool of numWorkers
+        processes (one per CPU by default). The samples are split into a
+        fixed number of shards, each with its own seed stream spawned from
+        the given seed, so the seed alone fixes the result, whatever the
+        number of workers. Only the counts come back from the
+        workers: the result is a dictionary mapping each node to a dictionary
+        of how many samples had each of its values"""
+        from BayesNet.parallelSampling import parallelPriorCounts
+        self.stats.samplesDrawn += numSamples
+        compiled = self.compile()
+        totals = parallelPriorCounts(compiled, numSamples, numWorkers, seed)
+        return {name: compiled.decodeDistribution(node, totals[node])
+                for node, name in enumerate(compiled.nodeNames)}
+
+
+    def parallelRejectionSampling(self, queryNode, evidenceDict, numSamples, numWorkers = None, seed = None):
+        """A parallel version of rejectionSampling: the samples are drawn
+        across a pool of processes with independent, reproducible seed
+        streams, and each worker sends back only its counts of the query
+        node's values among the samples that match the evidence"""
+        from BayesNet.parallelSampling import parallelRejection
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.parallelRejectionSampling(queryNode, evidenceDict, numSamples, numWorkers, seed)
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        counts = parallelRejection(compiled, queryId, compiled.encodeEvidence(evidenceDict),
+                                   numSamples, numWorkers, seed)
+        self.stats.samplesDrawn += numSamples
+        self.stats.rejections += numSamples - sum(counts)
+        self.stats.endQuery(start)
+        if sum(counts) == 0:
+            print("No samples found, try again and increase number of samples")
+            return None
+        probs = compiled.decodeDistribution(queryId, counts)
+        self.normalize(probs)
+        return probs
+
+
+    def parallelLikelihoodWeighting(self, queryNode, evidenceDict, numSamples, numWorkers = None, seed = None):
+        """A parallel version of likelihoodWeighting: the weighted samples
+        are drawn across a pool of processes with independent, reproducible
+        seed streams, and each worker sends back only its weight sums for the
+        query node's values"""
+        from BayesNet.parallelSampling import parallelLikelihood
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.parallelLikelihoodWeighting(queryNode, evidenceDict, numSamples, numWorkers, seed)
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        queryId = compiled.nodeId[queryNode]
+        probs = parallelLikelihood(compiled, queryId, compiled.encodeEvidence(evidenceDict),
+                                   numSamples, numWorkers, seed)
+        self.stats.samplesDrawn += numSamples
+        self.stats.endQuery(start)
+        if probs is None:
+            print("ERROR: every sample had zero weight, the evidence may be impossible")
+            return None
+        return compiled.decodeDistribution(queryId, probs)
             
         
         
         
+    # -----------------------------
+    # Anytime sampling
+
+    def anytimeSampling(self, queryNode, evidenceDict, method = "likelihood", precision = None,
+                        timeBudget = None, maxSamples = None, batchSize = 1000, seed = None, report = None):
+        """Estimates P(queryNode | evidence) by likelihood weighting (method
+        "likelihood") or rejection sampling (method "rejection") without
+        being told how many samples to draw. Samples are drawn in batches
+        until every value's 95% confidence interval has been at most
+        precision wide for two batches in a row (and at least
+        anytime.MIN_ANYTIME_SAMPLES samples have been drawn), timeBudget
+        seconds have passed, or maxSamples samples have been drawn,
+        whichever happens first (see anytime.py). After each batch the
+        current AnytimeEstimate, holding the estimate, the effective sample
+        size and the confidence intervals, is passed to report if it is
+        given, and to the tracer as an "anytime" event. Returns the final
+        AnytimeEstimate, whose probs field is the distribution"""
+        from BayesNet.anytime import anytimeSample
+        network, evidenceDict = self.relevantNetwork(queryNode, evidenceDict)
+        if network is not self:
+            return network.anytimeSampling(queryNode, evidenceDict, method, precision,
+                                           timeBudget, maxSamples, batchSize, seed, report)
+        start = self.stats.startQuery()
+        compiled = self.compile()
+        tracer = self.tracer
+
+        def batchDone(estimate):
+            if report is not None:
+                report(estimate)
+            if tracer is not None:
+                tracer("anytime", node=queryNode, probs=estimate.probs,
+                       effectiveSamples=estimate.effectiveSamples,
+                       samplesDrawn=estimate.samplesDrawn)
+
+        estimate = anytimeSample(compiled, compiled.nodeId[queryNode],
+                                 compiled.encodeEvidence(evidenceDict), method, precision,
+                                 timeBudget, maxSamples, batchSize, random.Random(seed).random,
+                                 batchDone)
+        self.stats.samplesDrawn += estimate.samplesDrawn
+        if method == "rejection":
+            self.stats.rejections += estimate.samplesDrawn - estimate.accepted
+        self.stats.endQuery(start)
+        return estimate
+
+
     def sampleNode(self, node, knownDict):
         """Takes in a node name and a dictionary where the keys are nodes
         and the values are those nodes' known values. This gets the probabilities
         for this node consistent with the knowns, and then does a weighted
-        sample from this node's values. It returns the value selected."""
-        probs = []
-        values = self.getNodeValues(node)
-        for nodeVal in values:
-            nextProb = self.lookupCPT(node, nodeVal, knownDict)
-            probs.append(nextProb)
-        return self.weightedSelection(values, probs)
+        sample from this node's values. It returns the value selected. The
+        draw uses the alias table of the compiled CPT row, so it takes
+        constant time however many values the node has."""
+        compiled = self.compile()
+        nodeId = compiled.nodeId[node]
+        valueId = compiled.drawValue(nodeId, compiled.rowFromKnowns(nodeId, knownDict))
+        return compiled.values[nodeId][valueId]
     
     
     
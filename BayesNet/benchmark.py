@@ -0,0 +1,220 @@
+""" A benchmark suite for the inference engines and samplers. Each suite
+builds a few seeded synthetic networks (see networkGenerators.py) and a
+seeded set of queries for each, then measures:
+
+ * every exact engine: time per query, and agreement with the reference
+   engine (enumeration on networks small enough for it, otherwise the
+   junction tree), which gets no error fields itself;
+ * every sampler: samples per second, and error against the exact answer;
+ * the peak memory of each of those runs, from tracemalloc.
+
+Every measurement is one JSON object written on its own line, so results
+from different runs can be appended to one file and compared over time.
+Run it as
+
+    python -m BayesNet.benchmark --suite small --output results.jsonl
+
+Networks are built with a query cache of size 0, so that repeated queries
+are really recomputed."""
+
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from BayesNet.networkGenerators import randomNetwork, randomQueries, wumpusGrid, wumpusQueries
+
+
+# Each suite lists its networks, as (name, builder, query maker) triples
+# where the builder takes the seed, along with the query settings shared by
+# its networks
+SUITES = {
+    "smoke": {
+        "networks": [
+            ("random-12", lambda seed: randomNetwork(12, maxInDegree=2, window=4, seed=seed), randomQueries),
+            ("wumpus-3x3", lambda seed: wumpusGrid(3, 3), wumpusQueries)],
+        "numQueries": 3, "numEvidence": 2, "numSamples": 500},
+    "small": {
+        "networks": [
+            ("random-15", lambda seed: randomNetwork(15, (2, 3), window=5, seed=seed), randomQueries),
+            ("random-40", lambda seed: randomNetwork(40, (2, 3), window=6, seed=seed), randomQueries),
+            ("wumpus-4x4", lambda seed: wumpusGrid(4, 4), wumpusQueries)],
+        "numQueries": 10, "numEvidence": 4, "numSamples": 5000},
+    "medium": {
+        "networks": [
+            ("random-100", lambda seed: randomNetwork(100, (2, 4), window=8, seed=seed), randomQueries),
+            ("random-200-sparse", lambda seed: randomNetwork(200, 2, 2, 5, seed), randomQueries),
+            ("wumpus-6x6", lambda seed: wumpusGrid(6, 6, falseBreeze=0.01), wumpusQueries)],
+        "numQueries": 20, "numEvidence": 6, "numSamples": 5000},
+}
+
+EXACT_ENGINES = ["elimination", "junction-tree", "enumeration"]
+
+# Enumeration is exponential in the number of nodes, so it is only timed on
+# networks at most this big
+ENUMERATION_LIMIT = 16
+
+
+def referenceEngine(network):
+    """Returns the exact engine whose answers the others are checked
+    against: enumeration, which shares no code with the factor-based
+    engines, when the network is small enough, and otherwise the junction
+    tree, which at least shares none of variable elimination's ordering"""
+    if len(network.nodeList) <= ENUMERATION_LIMIT:
+        return "enumeration"
+    return "junction-tree"
+
+
+def samplers(network, numSamples, seed):
+    """Returns a list of (name, function) pairs, where each function takes a
+    query node and an evidence dictionary and returns the estimated
+    distribution from numSamples samples (adaptive importance sampling draws
+    its learning rounds on top of those). The anytime samplers are given
+    numSamples as their sample limit and no precision, so they draw the same
+    number of samples as the rest. The parallel samplers use one worker
+    process per CPU, and need NumPy like the vectorized one"""
+    methods = [
+        ("rejection", lambda q, e: network.rejectionSampling(q, e, numSamples, seed=seed)),
+        ("likelihood", lambda q, e: network.likelihoodWeighting(q, e, numSamples, seed=seed)),
+        ("gibbs", lambda q, e: network.gibbsSampling(q, e, numSamples, seed=seed)),
+        ("adaptive-importance", lambda q, e: network.adaptiveImportanceSampling(q, e, numSamples, seed=seed)),
+        ("anytime-rejection",
+         lambda q, e: network.anytimeSampling(q, e, "rejection", maxSamples=numSamples, seed=seed).probs),
+        ("anytime-likelihood",
+         lambda q, e: network.anytimeSampling(q, e, "likelihood", maxSamples=numSamples, seed=seed).probs)]
+    if importlib.util.find_spec("numpy") is not None:
+        methods.extend([
+            ("likelihood-vectorized",
+             lambda q, e: network.likelihoodWeighting(q, e, numSamples, True, seed)),
+            ("rejection-parallel",
+             lambda q, e: network.parallelRejectionSampling(q, e, numSamples, seed=seed)),
+            ("likelihood-parallel",
+             lambda q, e: network.parallelLikelihoodWeighting(q, e, numSamples, seed=seed))])
+    return methods
+
+
+def runQueries(network, queries, answer):
+    """Answers every query with answer(query node, evidence), starting from
+    a network with nothing compiled. Returns the list of answers and the
+    time taken, which includes compiling"""
+    network._networkChanged()
+    start = time.perf_counter()
+    answers = [answer(query, evidence) for (query, evidence) in queries]
+    return answers, time.perf_counter() - start
+
+
+def peakMemory(network, queries, answer):
+    """Runs the same workload as runQueries under tracemalloc and returns
+    the peak number of bytes allocated. This is a separate run because
+    tracing slows Python down enough to spoil the timing"""
+    network._networkChanged()
+    tracemalloc.start()
+    try:
+        for (query, evidence) in queries:
+            answer(query, evidence)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def errors(answers, exact):
+    """Returns the largest and the mean (over queries) of the largest
+    absolute difference between an answer and the exact distribution, and
+    the number of queries with no answer at all"""
+    worst = []
+    failed = 0
+    for (answer, truth) in zip(answers, exact):
+        if answer is None:
+            failed += 1
+        else:
+            worst.append(max(abs(answer.get(value, 0.0) - truth[value]) for value in truth))
+    if worst == []:
+        return None, None, failed
+    return max(worst), sum(worst) / len(worst), failed
+
+
+def benchmarkNetwork(suiteName, netName, network, queries, numSamples, seed, memory=True):
+    """Runs every exact engine and every sampler on one network's queries,
+    returning the list of result records"""
+    base = {"suite": suiteName,
+            "network": netName,
+            "nodes": len(network.nodeList),
+            "edges": sum(len(parents) for parents in network.revEdges.values()),
+            "queries": len(queries),
+            "seed": seed}
+    records = []
+    reference = referenceEngine(network)
+    exact = runQueries(network, queries, lambda q, e: network.computeProbDist(q, e, reference))[0]
+
+    for engine in EXACT_ENGINES:
+        if engine == "enumeration" and len(network.nodeList) > ENUMERATION_LIMIT:
+            continue
+        answer = lambda q, e: network.computeProbDist(q, e, engine)
+        answers, seconds = runQueries(network, queries, answer)
+        record = dict(base, kind="exact", method=engine, reference=reference, seconds=seconds,
+                      secondsPerQuery=seconds / len(queries))
+        if engine != reference:
+            maxError, meanError, failed = errors(answers, exact)
+            record.update(maxError=maxError, meanError=meanError, failed=failed)
+        if memory:
+            record["peakBytes"] = peakMemory(network, queries, answer)
+        records.append(record)
+
+    for (name, answer) in samplers(network, numSamples, seed):
+        answers, seconds = runQueries(network, queries, answer)
+        maxError, meanError, failed = errors(answers, exact)
+        record = dict(base, kind="sampler", method=name, reference=reference, seconds=seconds,
+                      numSamples=numSamples, samplesPerSecond=numSamples * len(queries) / seconds,
+                      maxError=maxError, meanError=meanError, failed=failed)
+        if memory:
+            record["peakBytes"] = peakMemory(network, queries, answer)
+        records.append(record)
+    return records
+
+
+def runSuite(suiteName, seed=0, output=sys.stdout, memory=True, numSamples=None):
+    """Builds every network of the named suite and benchmarks it, writing
+    each record to output as a line of JSON as soon as its network is done.
+    Returns the list of records"""
+    suite = SUITES[suiteName]
+    if numSamples is None:
+        numSamples = suite["numSamples"]
+    environment = {"python": platform.python_version(),
+                   "platform": platform.platform(),
+                   "timestamp": time.time()}
+    records = []
+    for (netName, builder, makeQueries) in suite["networks"]:
+        start = time.perf_counter()
+        network = builder(seed)
+        buildSeconds = time.perf_counter() - start
+        queries = makeQueries(network, suite["numQueries"], suite["numEvidence"], seed)
+        for record in benchmarkNetwork(suiteName, netName, network, queries, numSamples, seed, memory):
+            record["buildSeconds"] = buildSeconds
+            record.update(environment)
+            output.write(json.dumps(record, sort_keys=True) + "\n")
+            output.flush()
+            records.append(record)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BayesNet inference engines and samplers")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samples", type=int, default=None,
+                        help="samples per sampler query (default: the suite's own)")
+    parser.add_argument("--output", default=None, help="file to append the JSON lines to")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    args = parser.parse_args(argv)
+    if args.output is None:
+        runSuite(args.suite, args.seed, sys.stdout, not args.no_memory, args.samples)
+    else:
+        with open(args.output, "a") as output:
+            runSuite(args.suite, args.seed, output, not args.no_memory, args.samples)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+""" Streaming readers for networks in the standard BIF and XMLBIF formats, such
+as the Alarm, Hepar2 or Pathfinder benchmark networks. Both fill the CPTs
+straight into the tensor backend (see tensorCPT.py) in a single pass over the
+file, without building a dictionary for each row."""
+
+import re
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from BayesNet.tensorCPT import TensorCPT
+
+TOKEN_PATTERN = re.compile(r'"[^"]*"|[{}()\[\],;|]|[^\s{}()\[\],;|"]+')
+
+
+def bifTokens(fileObj):
+    """A generator yielding the tokens of a BIF file one at a time, reading
+    it line by line. Comments (// to the end of a line, or /* ... */) are
+    skipped."""
+    inComment = False
+    for line in fileObj:
+        while line:
+            if inComment:
+                end = line.find("*/")
+                if end < 0:
+                    line = ""
+                    break
+                line = line[end + 2:]
+                inComment = False
+            lineComment = line.find("//")
+            blockComment = line.find("/*")
+            if blockComment >= 0 and (lineComment < 0 or blockComment < lineComment):
+                text = line[:blockComment]
+                line = line[blockComment + 2:]
+                inComment = True
+            else:
+                if lineComment >= 0:
+                    text = line[:lineComment]
+                else:
+                    text = line
+                line = ""
+            for token in TOKEN_PATTERN.findall(text):
+                yield token
+
+
+class BifParser:
+    """Reads a BIF file into a BayesNet. Variables must be declared before
+    the probability blocks that use them, as they are in the standard
+    benchmark files."""
+
+    def __init__(self, network, fileObj):
+        self.network = network
+        self.tokens = bifTokens(fileObj)
+        # Which block is being read, for error messages
+        self.current = None
+
+    def next(self):
+        """Returns the next token, or None at the end of the file"""
+        return next(self.tokens, None)
+
+    def endOfFile(self):
+        """Raises the error for a file that ends in the middle of a block"""
+        if self.current is None:
+            raise ValueError("BIF parse error: unexpected end of file")
+        raise ValueError("BIF parse error: unexpected end of file in " + self.current)
+
+    def expect(self, expected):
+        """Reads the next token and checks that it is the expected one"""
+        token = self.next()
+        if token is None:
+            self.endOfFile()
+        if token != expected:
+            raise ValueError("BIF parse error: expected " + expected + " but found " + str(token))
+
+    def skipBlock(self):
+        """Skips tokens up to the end of the current { ... } block, which has
+        already been opened"""
+        depth = 1
+        while depth > 0:
+            token = self.next()
+            if token is None:
+                self.endOfFile()
+            elif token == "{":
+                depth += 1
+            elif token == "}":
+                depth -= 1
+
+    def readList(self, closer):
+        """Reads a comma-separated list of tokens up to the closing token"""
+        items = []
+        token = self.next()
+        while token != closer:
+            if token is None:
+                self.endOfFile()
+            if token != ",":
+                items.append(token)
+            token = self.next()
+        return items
+
+    def skipStatement(self, token):
+        """Skips tokens, starting from the given one, up to the ; that ends
+        the current statement"""
+        while token != ";":
+            if token is None:
+                self.endOfFile()
+            token = self.next()
+
+    def parse(self):
+        token = self.next()
+        while token is not None:
+            if token == "network":
+                self.next()
+                self.expect("{")
+                self.skipBlock()
+            elif token == "variable":
+                self.parseVariable()
+            elif token == "probability":
+                self.parseProbability()
+            else:
+                raise ValueError("BIF parse error: unexpected " + token)
+            token = self.next()
+
+    def parseVariable(self):
+        """Reads a variable block: variable name { type discrete [ n ] { v1, v2, ... }; ... }"""
+        name = self.next()
+        self.current = "variable " + str(name)
+        self.expect("{")
+        values = None
+        token = self.next()
+        while token != "}":
+            if token is None:
+                self.endOfFile()
+            if token == "type":
+                self.next()
+                self.expect("[")
+                self.readList("]")
+                self.expect("{")
+                values = self.readList("}")
+                self.expect(";")
+            else:
+                # A property line: skip it
+                self.skipStatement(token)
+            token = self.next()
+        self.network.addNode(name, values)
+        self.current = None
+
+    def parseProbability(self):
+        """Reads a probability block, adding the node's incoming edges and
+        writing its rows straight into a new TensorCPT"""
+        network = self.network
+        self.current = "a probability block"
+        self.expect("(")
+        names = self.readList(")")
+        if names == []:
+            raise ValueError("BIF parse error: probability block without a variable")
+        node = names[0]
+        self.current = "the probability block for " + node
+        parents = [p for p in names[1:] if p != "|"]
+        for parent in parents:
+            network.addEdge(parent, node)
+        cpt = TensorCPT(network.nodeValues[node], [network.nodeValues[p] for p in parents])
+        numValues = len(cpt.values)
+        # Rows given explicitly, which a default line must not overwrite
+        # wherever it comes in the block
+        explicit = np.zeros(cpt.table.shape[0], dtype=bool)
+        self.expect("{")
+        token = self.next()
+        while token != "}":
+            if token is None:
+                self.endOfFile()
+            if token == "(":
+                row = cpt.rowIndex(self.readList(")"))
+                cpt.table[row] = [float(p) for p in self.readList(";")]
+                explicit[row] = True
+            elif token == "table":
+                # The node's value varies slowest, then the parents in order
+                probs = np.array([float(p) for p in self.readList(";")])
+                cpt.table[:] = probs.reshape(numValues, -1).T
+                explicit[:] = True
+            elif token == "default":
+                cpt.table[~explicit] = [float(p) for p in self.readList(";")]
+            else:
+                self.skipStatement(token)
+            token = self.next()
+        network.cpts[node] = cpt
+        self.current = None
+
+
+def readBif(network, filename):
+    """Reads a BIF file into the given (empty) BayesNet"""
+    network.cptBackend = "tensor"
+    with open(filename, "r") as fileObj:
+        BifParser(network, fileObj).parse()
+    network.setOrdering()
+    network._networkChanged()
+
+
+def readXmlBif(network, filename):
+    """Reads an XMLBIF file into the given (empty) BayesNet. The file is
+    parsed incrementally, and each VARIABLE and DEFINITION element is
+    discarded as soon as it has been used."""
+    network.cptBackend = "tensor"
+    for event, elem in ElementTree.iterparse(filename, events=("end",)):
+        tag = elem.tag.upper()
+        if tag == "VARIABLE":
+            name = elem.findtext("NAME").strip()
+            values = [outcome.text.strip() for outcome in elem.findall("OUTCOME")]
+            network.addNode(name, values)
+            elem.clear()
+        elif tag in ("DEFINITION", "PROBABILITY"):
+            node = elem.findtext("FOR").strip()
+            parents = [given.text.strip() for given in elem.findall("GIVEN")]
+            for parent in parents:
+                network.addEdge(parent, node)
+            cpt = TensorCPT(network.nodeValues[node], [network.nodeValues[p] for p in parents])
+            # Rows follow the parents in order, with the node's value
+            # varying fastest, which is exactly the TensorCPT layout
+            probs = np.array(elem.findtext("TABLE").split(), dtype=np.float64)
+            cpt.table[:] = probs.reshape(cpt.table.shape)
+            network.cpts[node] = cpt
+            elem.clear()
+    network.setOrdering()
+    network._networkChanged()
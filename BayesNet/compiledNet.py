@@ -0,0 +1,256 @@
+""" Defines a compiled, integer-only form of a BayesNet used by the fast
+inference paths"""
+
+import pickle
+import random
+
+from BayesNet.factors import Factor, computeStrides, tableSize
+from BayesNet.weightedSelection import AliasTable
+
+
+class CompiledNet:
+    """A snapshot of a BayesNet in which every node and every value has been
+    interned to a dense integer id. Nodes are numbered in topological order,
+    so sampling simply runs through the ids 0, 1, 2, ... Each node's CPT is
+    a flat list holding one row of probabilities per combination of parent
+    values: the probability of value v given the parents' values is at
+    position row * card + v, where row is the mixed-radix code of the parent
+    values. Assignments are lists of value ids indexed by node id, and are
+    only turned back into string-keyed dictionaries at the BayesNet API.
+    Each CPT row gets an alias table the first time a value is drawn from
+    it, so every later draw from that row takes constant time. A BayesNet
+    builds a new CompiledNet whenever a CPT changes, which throws the alias
+    tables away along with everything else. A parametric or sparse CPT
+    (see parametricCPT.py and sparseCPT.py) is held as a FlatView, which
+    computes its rows when they are first read; a noisy-OR or noisy-MAX
+    CPT also contributes its own decomposition to the factors instead of
+    one table over all of its parents."""
+
+    def __init__(self, nodeNames, values, parents, tables):
+        """Takes in the node names in topological order, a parallel list of
+        each node's list of values, a list of each node's parent ids (in CPT
+        order), and a list of each node's flat CPT"""
+        self.nodeNames = list(nodeNames)
+        self.nodeId = {name: i for i, name in enumerate(self.nodeNames)}
+        self.values = [list(vals) for vals in values]
+        self.valueId = [{val: i for i, val in enumerate(vals)} for vals in self.values]
+        self.cards = [len(vals) for vals in self.values]
+        self.parents = [list(ps) for ps in parents]
+        self.parentStrides = [computeStrides([self.cards[p] for p in ps]) for ps in self.parents]
+        self.children = [[] for name in self.nodeNames]
+        for node, ps in enumerate(self.parents):
+            for p in ps:
+                self.children[p].append(node)
+        self.tables = tables
+        self.aliasTables = [{} for name in self.nodeNames]
+        self.factors = []
+        for node in range(len(self.nodeNames)):
+            table = self.tables[node]
+            if hasattr(table, "factors"):
+                self.factors.extend(table.factors(self.parents[node], node))
+            else:
+                self.factors.append(Factor(self.parents[node] + [node],
+                                           [self.cards[p] for p in self.parents[node]] + [self.cards[node]],
+                                           table))
+
+
+    def __len__(self):
+        return len(self.nodeNames)
+
+
+    # ======================================================================
+    # Translating between names and ids
+
+    def encodeEvidence(self, knownDict):
+        """Converts a dictionary of node names and values into a dictionary
+        of node ids and value ids"""
+        evidence = {}
+        for name in knownDict:
+            node = self.nodeId[name]
+            evidence[node] = self.valueId[node][knownDict[name]]
+        return evidence
+
+
+    def decodeAssignment(self, assignment):
+        """Converts a list of value ids (one per node) back into a dictionary
+        of node names and values"""
+        return {self.nodeNames[node]: self.values[node][v]
+                for node, v in enumerate(assignment)}
+
+
+    def decodeDistribution(self, node, probs):
+        """Converts a list of probabilities indexed by value id into a
+        dictionary keyed by the node's values"""
+        return dict(zip(self.values[node], probs))
+
+
+    # ======================================================================
+    # Integer-only sampling
+
+    def rowIndex(self, node, assignment):
+        """Returns the CPT row of the node selected by its parents' values in
+        the given assignment"""
+        row = 0
+        for p, stride in zip(self.parents[node], self.parentStrides[node]):
+            row += assignment[p] * stride
+        return row
+
+
+    def rowFromKnowns(self, node, knownDict):
+        """Returns the CPT row of the node selected by its parents' values in
+        a dictionary of node names and values"""
+        row = 0
+        for p, stride in zip(self.parents[node], self.parentStrides[node]):
+            row += self.valueId[p][knownDict[self.nodeNames[p]]] * stride
+        return row
+
+
+    def drawValue(self, node, row, rand=random.random):
+        """Draws a value id for the node from the given row of its CPT, using
+        the row's alias table (built on first use)"""
+        aliasTable = self.aliasTables[node].get(row)
+        if aliasTable is None:
+            card = self.cards[node]
+            aliasTable = AliasTable(self.tables[node][row * card:(row + 1) * card])
+            self.aliasTables[node][row] = aliasTable
+        return aliasTable.draw(rand)
+
+
+    def sample(self, rand=random.random):
+        """Generates one sample from the prior, as a list of value ids"""
+        assignment = [0] * len(self.nodeNames)
+        for node in range(len(self.nodeNames)):
+            assignment[node] = self.drawValue(node, self.rowIndex(node, assignment), rand)
+        return assignment
+
+
+    def weightedSample(self, evidence, rand=random.random, proposal=None):
+        """Given a dictionary mapping evidence node ids to value ids,
+        generates one likelihood-weighted sample: evidence nodes keep their
+        values and multiply the weight by their probability, and the other
+        nodes are sampled given their parents. Returns the assignment and
+        its weight. If a proposal (an ImportanceFunction, see
+        importanceSampling.py) is given, the nodes it adapts are drawn from
+        it instead, and each multiplies the weight by its CPT probability
+        over its proposal probability, making this importance sampling."""
+        assignment = [0] * len(self.nodeNames)
+        weight = 1.0
+        for node in range(len(self.nodeNames)):
+            row = self.rowIndex(node, assignment)
+            if node in evidence:
+                v = evidence[node]
+                assignment[node] = v
+                weight *= self.tables[node][row * self.cards[node] + v]
+            elif proposal is not None and proposal.adapts[node]:
+                v = proposal.drawValue(node, row, rand)
+                assignment[node] = v
+                weight *= self.tables[node][row * self.cards[node] + v] / proposal.probability(node, row, v)
+            else:
+                assignment[node] = self.drawValue(node, row, rand)
+        return assignment, weight
+
+
+    def rejectionSample(self, evidence, assignment, rand=random.random, numNodes=None):
+        """Samples the first numNodes nodes (all of them by default) from the
+        prior, writing the value ids into the given assignment list so no
+        new list is built. Each evidence node is kept with the probability of
+        its observed value, which is the same as drawing it and rejecting a
+        mismatch, and the sample is abandoned at the first rejection.
+        Returns True if the sample is consistent with the evidence"""
+        if numNodes is None:
+            numNodes = len(self.nodeNames)
+        for node in range(numNodes):
+            row = self.rowIndex(node, assignment)
+            if node in evidence:
+                v = evidence[node]
+                card = self.cards[node]
+                start = row * card
+                table = self.tables[node]
+                if rand() * sum(table[start:start + card]) >= table[start + v]:
+                    return False
+                assignment[node] = v
+            else:
+                assignment[node] = self.drawValue(node, row, rand)
+        return True
+
+
+class FlatView:
+    """Looks like the flat list of a CPT's rows (indexing and slicing work),
+    but computes each row from the CPT when it is read. The CPT
+    needs values, parentCards and rowAt(row), as every CPT built on
+    cptBase.py provides. The
+    compiled samplers only ever read the rows of parent values that
+    actually occur, so the full table is never built. Only the last row
+    read is kept, so that reading a row entry by entry computes it once,
+    and memory does not grow with the number of rows read."""
+
+    def __init__(self, cpt):
+        self.cpt = cpt
+        self.card = len(cpt.values)
+        self.length = tableSize(cpt.parentCards) * self.card
+        self.lastRow = None
+        self.lastProbs = None
+
+    def rowProbs(self, row):
+        if row != self.lastRow:
+            self.lastProbs = self.cpt.rowAt(row)
+            self.lastRow = row
+        return self.lastProbs
+
+    def factors(self, parentVars, nodeVar):
+        """Returns the CPT's own factors if it has a decomposition, or else
+        a single factor whose table is this view, so that even exact
+        inference only computes the rows it reads"""
+        if hasattr(self.cpt, "factors"):
+            return self.cpt.factors(parentVars, nodeVar)
+        cards = list(self.cpt.parentCards) + [self.card]
+        return [Factor(list(parentVars) + [nodeVar], cards, self)]
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for row in range(self.length // self.card):
+            for prob in self.rowProbs(row):
+                yield prob
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if step == 1 and start < stop and start // self.card == (stop - 1) // self.card:
+                row = start // self.card
+                base = row * self.card
+                return self.rowProbs(row)[start - base:stop - base]
+            return [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self.length
+        row, v = divmod(index, self.card)
+        return self.rowProbs(row)[v]
+
+
+def picklable(compiled):
+    """Returns whether the compiled network can be sent to a worker process.
+    The only part of a network that might not be picklable is the function
+    of a deterministic node, such as a lambda or a nested function"""
+    try:
+        pickle.dumps(compiled)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        return False
+    return True
+
+
+def compileNetwork(network):
+    """Builds the CompiledNet for a BayesNet, whose nodeOrder must hold a
+    topological order of all its nodes"""
+    nodeNames = network.nodeOrder
+    nodeId = {name: i for i, name in enumerate(nodeNames)}
+    values = [network.nodeValues[name] for name in nodeNames]
+    parents = [[nodeId[p] for p in network.revEdges[name]] for name in nodeNames]
+    tables = []
+    for name in nodeNames:
+        table = network.cpts[name]
+        if hasattr(table, "flatView"):
+            tables.append(table.flatView())
+        else:
+            tables.append(network.nodeFactor(name).table)
+    return CompiledNet(nodeNames, values, parents, tables)
@@ -0,0 +1,55 @@
+""" Confidence intervals used to decide when a sampler has drawn enough
+samples"""
+
+import math
+
+# The normal quantile for a two-sided 95% confidence interval
+Z_95 = 1.96
+
+# Intervals from fewer accepted samples than this are not trusted for
+# stopping, since the normal approximation behind them is poor
+MIN_SAMPLES = 30
+
+
+def wilsonInterval(p, n, z=Z_95):
+    """Returns the (low, high) Wilson score confidence interval for a
+    probability estimated as p from n samples. Unlike the plain normal
+    interval, it does not shrink to nothing for a value that has not been
+    seen yet. n need not be a whole number, so an effective sample size
+    can be used for weighted samples"""
+    if n <= 0:
+        return (0.0, 1.0)
+    scale = 1.0 + z * z / n
+    center = (p + z * z / (2.0 * n)) / scale
+    spread = z * math.sqrt(p * (1.0 - p) / n + z * z / (4.0 * n * n)) / scale
+    return (max(0.0, center - spread), min(1.0, center + spread))
+
+
+def proportionHalfWidths(counts, total, z=Z_95):
+    """Given the counts of each value among total samples, returns the
+    half-width of the Wilson confidence interval around each value's
+    estimated probability"""
+    if total == 0:
+        return [float("inf")] * len(counts)
+    widths = []
+    for c in counts:
+        (low, high) = wilsonInterval(c / total, total, z)
+        widths.append((high - low) / 2.0)
+    return widths
+
+
+def intervalsNarrowEnough(counts, total, width, z=Z_95):
+    """Returns True once there are enough samples and every value's
+    confidence interval is at most the given (full) width"""
+    if total < MIN_SAMPLES:
+        return False
+    return 2.0 * max(proportionHalfWidths(counts, total, z)) <= width
+
+
+def effectiveSampleSize(weightSum, squaredWeightSum):
+    """Returns Kish's effective sample size of a set of weighted samples,
+    given the sum of their weights and the sum of their squared weights:
+    the number of unweighted samples that would be about as informative"""
+    if squaredWeightSum == 0.0:
+        return 0.0
+    return weightSum * weightSum / squaredWeightSum
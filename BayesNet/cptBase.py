@@ -0,0 +1,154 @@
+""" Defines the base class shared by the CPT backends that replace BayesNet's
+nested dictionaries (tensorCPT.py, sparseCPT.py and parametricCPT.py). Each
+numbers its rows by the mixed-radix code of the parents' value positions, the
+first parent changing slowest as in recGivensBuild, and only has to say how to
+read one row."""
+
+from abc import ABC, abstractmethod
+
+from BayesNet.factors import computeStrides, tableSize
+
+
+class CPTBase(ABC):
+    """The parts shared by every CPT backend: turning parent values into row
+    numbers and back, lookups, expansion to a flat table or nested
+    dictionaries, and dictionary-style access, so that cpt[value][givens]
+    works just like the nested dictionaries. A subclass provides rowAt, may
+    provide a faster entryAt, and provides setValue if it can be changed
+    entry by entry."""
+
+    def __init__(self, values, parentValues):
+        """Takes in the list of the node's values and a list holding the list
+        of values for each parent, in CPT order"""
+        self.values = list(values)
+        self.valueIndex = {value: i for i, value in enumerate(self.values)}
+        self.parentValues = [list(vals) for vals in parentValues]
+        self.parentIndex = [{value: i for i, value in enumerate(vals)}
+                            for vals in self.parentValues]
+        self.parentCards = [len(vals) for vals in self.parentValues]
+        self.strides = computeStrides(self.parentCards)
+
+
+    @abstractmethod
+    def rowAt(self, row):
+        """Returns the list of probabilities of the node's values in the
+        given row. The list may be shared, so callers must not change it"""
+
+
+    def entryAt(self, row, v):
+        """Returns the probability of value position v in the given row"""
+        return self.rowAt(row)[v]
+
+
+    def rowIndex(self, givens):
+        """Given a sequence of parent values in CPT order, returns the number
+        of the row that holds them"""
+        row = 0
+        for index, stride, given in zip(self.parentIndex, self.strides, givens):
+            row += index[given] * stride
+        return row
+
+
+    def parentIdsOf(self, row):
+        """Returns the parent value positions that make up the given row"""
+        return [(row // stride) % card for stride, card in zip(self.strides, self.parentCards)]
+
+
+    def lookup(self, value, givens):
+        """Returns P(value | givens)"""
+        return self.entryAt(self.rowIndex(givens), self.valueIndex[value])
+
+
+    def lookupKnowns(self, parents, value, knownDict):
+        """Like lookup, but reads the parent values straight out of a
+        dictionary of known values, given the parents' names. Returns None if
+        some parent has no known value"""
+        row = 0
+        for parent, index, stride in zip(parents, self.parentIndex, self.strides):
+            given = knownDict.get(parent)
+            if given is None:
+                return None
+            row += index[given] * stride
+        return self.entryAt(row, self.valueIndex[value])
+
+
+    def setValue(self, value, givens, prob):
+        raise ValueError("This CPT cannot be set entry by entry")
+
+
+    def rowsSumToOne(self, tolerance):
+        """Returns whether every row's probabilities add up to one, to
+        within the given tolerance"""
+        for row in range(tableSize(self.parentCards)):
+            if abs(sum(self.rowAt(row)) - 1.0) > tolerance:
+                return False
+        return True
+
+
+    def row(self, givens):
+        """Returns the list of probabilities of each of the node's values,
+        given a sequence of parent values"""
+        return list(self.rowAt(self.rowIndex(givens)))
+
+
+    def flatTable(self):
+        """Returns the whole table as one flat list, rows one after another,
+        which is the layout of a factor over the parents followed by the
+        node"""
+        table = []
+        for row in range(tableSize(self.parentCards)):
+            table.extend(self.rowAt(row))
+        return table
+
+
+    def toDict(self):
+        """Builds the equivalent nested dictionary, keyed first by value and
+        then by the tuple of parent values"""
+        cpt = {value: {} for value in self.values}
+        for row in range(tableSize(self.parentCards)):
+            givens = tuple(vals[i] for vals, i in zip(self.parentValues, self.parentIdsOf(row)))
+            for value, prob in zip(self.values, self.rowAt(row)):
+                cpt[value][givens] = prob
+        return cpt
+
+
+    # ----------------------------------------------------------------
+    # Dictionary-style access, so that cpt[value][givens] keeps working
+
+    def __getitem__(self, value):
+        if value not in self.valueIndex:
+            raise KeyError(value)
+        return CPTColumn(self, value)
+
+    def __contains__(self, value):
+        return value in self.valueIndex
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def keys(self):
+        return list(self.values)
+
+
+class CPTColumn:
+    """A view of the probabilities of one value of a CPT, indexed by tuples
+    of parent values"""
+
+    def __init__(self, cpt, value):
+        self.cpt = cpt
+        self.value = value
+
+    def __getitem__(self, givens):
+        try:
+            return self.cpt.lookup(self.value, givens)
+        except (KeyError, TypeError):
+            raise KeyError(givens)
+
+    def __setitem__(self, givens, prob):
+        self.cpt.setValue(self.value, givens, prob)
+
+    def get(self, givens, default=None):
+        try:
+            return self[givens]
+        except KeyError:
+            return default
@@ -0,0 +1,184 @@
+""" Defines the Factor class used by the exact inference engines"""
+
+
+def computeStrides(cards):
+    """Given a list of variable cardinalities, computes the mixed-radix
+    strides of a flat table over those variables. The last variable changes
+    fastest, which matches the order in which recGivensBuild lists the rows
+    of a CPT (the first parent changes slowest)."""
+    strides = [0] * len(cards)
+    step = 1
+    for i in range(len(cards) - 1, -1, -1):
+        strides[i] = step
+        step *= cards[i]
+    return strides
+
+
+def tableSize(cards):
+    """Returns the number of entries in a table over variables with the given
+    cardinalities"""
+    size = 1
+    for card in cards:
+        size *= card
+    return size
+
+
+class Factor:
+    """A factor maps every joint assignment of its variables to a number. The
+    variables are identified by name, and their values by position (0 up to
+    the variable's cardinality), so the table itself is a flat list indexed
+    by the mixed-radix code of the assignment."""
+
+    def __init__(self, variables, cards, table):
+        """Takes in a list of variable names, a parallel list of their
+        cardinalities, and a flat list holding one entry per joint
+        assignment (the last variable changing fastest)"""
+        self.variables = list(variables)
+        self.cards = list(cards)
+        self.table = table
+        self.strides = computeStrides(self.cards)
+
+    def __repr__(self):
+        return "Factor(" + str(self.variables) + ", " + str(self.table) + ")"
+
+    def cardOf(self, var):
+        """Returns the cardinality of the given variable in this factor"""
+        return self.cards[self.variables.index(var)]
+
+    def value(self, assignment):
+        """Given a dictionary mapping (at least) this factor's variables to
+        value indices, returns the matching table entry"""
+        pos = 0
+        for var, stride in zip(self.variables, self.strides):
+            pos += assignment[var] * stride
+        return self.table[pos]
+
+    def multiply(self, other):
+        """Computes the product of this factor with another one, returning a
+        new factor whose scope is the union of the two scopes. The two tables
+        are walked together with one odometer over the result assignments, so
+        no assignment is ever built as a dictionary."""
+        variables = self.variables[:]
+        cards = self.cards[:]
+        for var, card in zip(other.variables, other.cards):
+            if var not in self.variables:
+                variables.append(var)
+                cards.append(card)
+        selfStrideOf = dict(zip(self.variables, self.strides))
+        otherStrideOf = dict(zip(other.variables, other.strides))
+        selfStrides = [selfStrideOf.get(var, 0) for var in variables]
+        otherStrides = [otherStrideOf.get(var, 0) for var in variables]
+
+        selfTable = self.table
+        otherTable = other.table
+        size = tableSize(cards)
+        table = [0.0] * size
+        assignment = [0] * len(variables)
+        j = 0
+        k = 0
+        last = len(variables) - 1
+        for i in range(size):
+            table[i] = selfTable[j] * otherTable[k]
+            for l in range(last, -1, -1):
+                assignment[l] += 1
+                if assignment[l] < cards[l]:
+                    j += selfStrides[l]
+                    k += otherStrides[l]
+                    break
+                assignment[l] = 0
+                j -= (cards[l] - 1) * selfStrides[l]
+                k -= (cards[l] - 1) * otherStrides[l]
+        return Factor(variables, cards, table)
+
+    def sumOut(self, var):
+        """Returns a new factor with the given variable summed out"""
+        return self._marginalize(var, False)
+
+    def _marginalize(self, var, useMax):
+        """Removes var from the factor, combining the entries that differ
+        only in var's value either by adding them or by taking the maximum"""
+        if var not in self.variables:
+            return self
+        pos = self.variables.index(var)
+        variables = self.variables[:pos] + self.variables[pos + 1:]
+        cards = self.cards[:pos] + self.cards[pos + 1:]
+        resultStrides = computeStrides(cards)
+        strides = resultStrides[:pos] + [0] + resultStrides[pos:]
+
+        size = tableSize(cards)
+        if useMax:
+            table = [float("-inf")] * size
+        else:
+            table = [0.0] * size
+        srcTable = self.table
+        srcCards = self.cards
+        assignment = [0] * len(srcCards)
+        r = 0
+        last = len(srcCards) - 1
+        for i in range(len(srcTable)):
+            if useMax:
+                if srcTable[i] > table[r]:
+                    table[r] = srcTable[i]
+            else:
+                table[r] += srcTable[i]
+            for l in range(last, -1, -1):
+                assignment[l] += 1
+                if assignment[l] < srcCards[l]:
+                    r += strides[l]
+                    break
+                assignment[l] = 0
+                r -= (srcCards[l] - 1) * strides[l]
+        return Factor(variables, cards, table)
+
+    def reduce(self, evidence):
+        """Given a dictionary mapping variables to value indices, returns a
+        new factor restricted to the rows consistent with the evidence, with
+        the evidence variables dropped from its scope"""
+        fixed = [var for var in self.variables if var in evidence]
+        if fixed == []:
+            return self
+        base = 0
+        variables = []
+        cards = []
+        srcStrides = []
+        for var, card, stride in zip(self.variables, self.cards, self.strides):
+            if var in evidence:
+                base += evidence[var] * stride
+            else:
+                variables.append(var)
+                cards.append(card)
+                srcStrides.append(stride)
+
+        size = tableSize(cards)
+        table = [0.0] * size
+        srcTable = self.table
+        assignment = [0] * len(variables)
+        j = base
+        last = len(variables) - 1
+        for i in range(size):
+            table[i] = srcTable[j]
+            for l in range(last, -1, -1):
+                assignment[l] += 1
+                if assignment[l] < cards[l]:
+                    j += srcStrides[l]
+                    break
+                assignment[l] = 0
+                j -= (cards[l] - 1) * srcStrides[l]
+        return Factor(variables, cards, table)
+
+    def total(self):
+        """Returns the sum of all the entries in the factor"""
+        return sum(self.table)
+
+
+def multiplyAll(factors):
+    """Multiplies together a list of factors, returning the product. The
+    product of no factors is the constant factor 1"""
+    if factors == []:
+        return Factor([], [], [1.0])
+    # Multiplying the small factors first keeps the intermediate tables small
+    ordered = sorted(factors, key=lambda f: len(f.table))
+    result = ordered[0]
+    for factor in ordered[1:]:
+        result = result.multiply(factor)
+    return result
@@ -0,0 +1,102 @@
+""" Implements Gibbs sampling on a CompiledNet, with the Markov blanket of every
+node worked out ahead of time"""
+
+import random
+
+
+class GibbsSampler:
+    """Precomputes, for every node, the CPTs that mention it, which cover its
+    Markov blanket: its own CPT and the CPTs of its children. For each of those
+    CPTs it records how far one step in the node's value moves through the
+    table, so that resampling a node only reads the few table entries in its
+    blanket, rather than re-evaluating the whole network."""
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.touched = []
+        for node in range(len(compiled)):
+            touched = [(node, 0)]
+            for child in compiled.children[node]:
+                pos = compiled.parents[child].index(node)
+                touched.append((child, compiled.parentStrides[child][pos] * compiled.cards[child]))
+            self.touched.append(touched)
+
+
+    def blanketDistribution(self, node, assignment):
+        """Computes P(node | Markov blanket) for the current assignment,
+        returning the unnormalized list of weights indexed by value id. The
+        node's own entry in the assignment is ignored."""
+        compiled = self.compiled
+        card = compiled.cards[node]
+        weights = [1.0] * card
+        saved = assignment[node]
+        assignment[node] = 0
+        for (cpt, step) in self.touched[node]:
+            table = compiled.tables[cpt]
+            cptCard = compiled.cards[cpt]
+            if cpt == node:
+                pos = compiled.rowIndex(node, assignment) * cptCard
+                step = 1
+            else:
+                pos = compiled.rowIndex(cpt, assignment) * cptCard + assignment[cpt]
+            for v in range(card):
+                weights[v] *= table[pos]
+                pos += step
+        assignment[node] = saved
+        return weights
+
+
+    def resample(self, node, assignment, rand=random.random):
+        """Draws a new value for the node given its Markov blanket, and
+        stores it in the assignment. If every value has zero probability
+        (which can only happen from an impossible starting state) the node
+        keeps its value."""
+        weights = self.blanketDistribution(node, assignment)
+        total = sum(weights)
+        if total <= 0.0:
+            return
+        threshold = rand() * total
+        cumulative = 0.0
+        for v in range(len(weights)):
+            cumulative += weights[v]
+            if cumulative > threshold:
+                assignment[node] = v
+                return
+        assignment[node] = len(weights) - 1
+
+
+    def initialState(self, evidence, rand=random.random, tries=100):
+        """Builds a starting state for a chain that agrees with the evidence,
+        using likelihood-weighted samples so that the state has nonzero
+        probability whenever possible"""
+        for i in range(tries):
+            assignment, weight = self.compiled.weightedSample(evidence, rand)
+            if weight > 0.0:
+                return assignment
+        return assignment
+
+
+    def sweeps(self, evidence, numSweeps, burnIn=0, thin=1, rand=random.random):
+        """A generator that runs one chain: after burnIn discarded sweeps, it
+        performs numSweeps sweeps (each resampling every non-evidence node
+        once, in order) and yields the state after every thin-th one. The
+        same list is yielded each time, so copy it to keep it."""
+        assignment = self.initialState(evidence, rand)
+        free = [node for node in range(len(self.compiled)) if node not in evidence]
+        for sweep in range(burnIn + numSweeps):
+            for node in free:
+                self.resample(node, assignment, rand)
+            if sweep >= burnIn and (sweep - burnIn) % thin == thin - 1:
+                yield assignment
+
+
+    def queryCounts(self, queryNode, evidence, numSweeps, burnIn=0, thin=1,
+                    numChains=1, rand=random.random):
+        """Runs numChains independent chains and counts how often each value
+        of the query node (an id) appears in the recorded states. Returns the
+        list of counts indexed by value id."""
+        counts = [0] * self.compiled.cards[queryNode]
+        for chain in range(numChains):
+            for state in self.sweeps(evidence, numSweeps, burnIn, thin, rand):
+                counts[state[queryNode]] += 1
+        return counts
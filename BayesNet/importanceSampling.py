@@ -0,0 +1,170 @@
+""" Adaptive importance sampling (AIS-BN) for queries with unlikely evidence.
+Likelihood weighting samples every node from its CPT, so when the evidence is
+unlikely almost every sample contradicts it upstream and gets a tiny weight.
+AIS-BN instead samples from an importance function: a second set of CPTs
+(ICPTs) that it learns over a few rounds to approximate P(node | parents,
+evidence), so that most samples land where the evidence is likely."""
+
+import random
+
+from BayesNet.convergence import effectiveSampleSize
+from BayesNet.weightedSelection import AliasTable
+
+# The learning rate for round k of kmax is RATE_START * (RATE_END /
+# RATE_START) ** (k / kmax), so the early rounds move the ICPTs quickly and
+# the later ones settle them (the schedule from the AIS-BN paper)
+RATE_START = 0.4
+RATE_END = 0.14
+
+# ICPT probabilities are kept at or above SMALL_PROB / card, so that no value
+# the real CPT allows is sampled too rarely to correct a wrong guess (0.04
+# for a two-valued node, as in the AIS-BN paper)
+SMALL_PROB = 0.08
+
+
+class ImportanceFunction:
+    """The importance function of AIS-BN over a CompiledNet and a set of
+    evidence. Only the ancestors of the evidence nodes get ICPTs, since
+    the optimal importance function for any other node is its own CPT. Each
+    of their ICPT rows is built the first time it is used: it starts from
+    the CPT row, or from the uniform distribution for a parent of an
+    evidence node (the first AIS-BN heuristic), with small probabilities
+    raised (the second heuristic). Every row gets an alias table for
+    drawing, rebuilt after each update."""
+
+    def __init__(self, compiled, evidence, uniformParents=True):
+        self.compiled = compiled
+        self.evidence = evidence
+        self.adapts = [False] * len(compiled)
+        self.uniform = [False] * len(compiled)
+        stack = list(evidence)
+        while stack != []:
+            node = stack.pop()
+            for p in compiled.parents[node]:
+                if p not in evidence and not self.adapts[p]:
+                    self.adapts[p] = True
+                    stack.append(p)
+        if uniformParents:
+            for node in evidence:
+                for p in compiled.parents[node]:
+                    self.uniform[p] = self.adapts[p]
+        self.rows = [{} for node in range(len(compiled))]
+        self.aliasTables = [{} for node in range(len(compiled))]
+
+
+    def adaptingNodes(self):
+        """Returns the ids of the nodes that have ICPTs"""
+        return [node for node in range(len(self.compiled)) if self.adapts[node]]
+
+
+    def rowProbs(self, node, row):
+        """Returns the ICPT row of a node that adapts, building it if it is
+        new"""
+        probs = self.rows[node].get(row)
+        if probs is None:
+            card = self.compiled.cards[node]
+            if self.uniform[node]:
+                probs = [1.0 / card] * card
+            else:
+                probs = _raiseSmall(self.compiled.tables[node][row * card:(row + 1) * card])
+            self.rows[node][row] = probs
+        return probs
+
+
+    def probability(self, node, row, v):
+        """Returns the importance probability of value v in the given row"""
+        return self.rowProbs(node, row)[v]
+
+
+    def drawValue(self, node, row, rand=random.random):
+        """Draws a value id for the node from the given row of its ICPT"""
+        aliasTable = self.aliasTables[node].get(row)
+        if aliasTable is None:
+            aliasTable = AliasTable(self.rowProbs(node, row))
+            self.aliasTables[node][row] = aliasTable
+        return aliasTable.draw(rand)
+
+
+    def update(self, totals, rate):
+        """Moves each ICPT row toward the weighted estimate of P(node |
+        parents, evidence) from the last round's samples, given as totals,
+        a dictionary mapping (node, row) pairs to the total weight of each
+        value. Rows that no sample reached are left alone"""
+        for (node, row), weights in totals.items():
+            total = sum(weights)
+            if total <= 0.0:
+                continue
+            old = self.rowProbs(node, row)
+            new = [q + rate * (w / total - q) for q, w in zip(old, weights)]
+            self.rows[node][row] = _raiseSmall(new)
+            self.aliasTables[node].pop(row, None)
+
+
+def _raiseSmall(probs):
+    """Returns a copy of a distribution with every probability below
+    SMALL_PROB / card raised to it, renormalized. A row of all zeros (one
+    that can never be reached) becomes uniform"""
+    total = sum(probs)
+    card = len(probs)
+    if total <= 0.0:
+        return [1.0 / card] * card
+    floor = SMALL_PROB / card
+    raised = [max(p / total, floor) for p in probs]
+    total = sum(raised)
+    return [p / total for p in raised]
+
+
+def adaptiveImportanceSample(compiled, queryId, evidence, numSamples, rounds=10,
+                             samplesPerRound=1000, rand=random.random, report=None):
+    """Estimates the posterior of the query node (an id in the CompiledNet)
+    given evidence (a dictionary of node ids to value ids) by AIS-BN. First
+    the importance function is learned over the given number of rounds of
+    samplesPerRound samples each: after each round, every ICPT row moves
+    toward the weighted frequencies of its node's values among that round's
+    samples. Then numSamples samples are drawn from the learned importance
+    function, each weighted by P(sample, evidence) / Q(sample). If report is
+    given, it is called after each learning round with the round number and
+    that round's effective sample size. If no node has an ICPT (no evidence
+    node has a parent outside the evidence) there is nothing to learn, and
+    the learning rounds are skipped. Returns the list of probabilities of
+    the query's values (None if every sample had zero weight), the
+    effective sample size of the final samples, and the total number of
+    samples drawn, learning rounds included"""
+    proposal = ImportanceFunction(compiled, evidence)
+    adapting = proposal.adaptingNodes()
+    drawn = numSamples
+    if adapting != []:
+        drawn += rounds * samplesPerRound
+        for k in range(rounds):
+            totals = {}
+            weightSum = 0.0
+            squaredWeightSum = 0.0
+            for i in range(samplesPerRound):
+                (sample, weight) = compiled.weightedSample(evidence, rand, proposal)
+                if weight <= 0.0:
+                    continue
+                weightSum += weight
+                squaredWeightSum += weight * weight
+                for node in adapting:
+                    key = (node, compiled.rowIndex(node, sample))
+                    weights = totals.get(key)
+                    if weights is None:
+                        weights = [0.0] * compiled.cards[node]
+                        totals[key] = weights
+                    weights[sample[node]] += weight
+            proposal.update(totals, RATE_START * (RATE_END / RATE_START) ** (k / rounds))
+            if report is not None:
+                report(k, effectiveSampleSize(weightSum, squaredWeightSum))
+
+    sums = [0.0] * compiled.cards[queryId]
+    weightSum = 0.0
+    squaredWeightSum = 0.0
+    for i in range(numSamples):
+        (sample, weight) = compiled.weightedSample(evidence, rand, proposal)
+        sums[sample[queryId]] += weight
+        weightSum += weight
+        squaredWeightSum += weight * weight
+    ess = effectiveSampleSize(weightSum, squaredWeightSum)
+    if weightSum <= 0.0:
+        return None, ess, drawn
+    return [s / weightSum for s in sums], ess, drawn
@@ -0,0 +1,92 @@
+""" Counters and tracing hooks for profiling a BayesNet"""
+
+import time
+
+
+class QueryStats:
+    """Counts the work done by a BayesNet: CPT lookups, nodes visited by the
+    enumeration recursion, samples drawn, samples rejected, and the number of
+    queries answered along with the time they took. The effective sample
+    size of the last adaptive importance sampling query is kept too"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Sets every counter back to zero"""
+        self.cptLookups = 0
+        self.recursionNodes = 0
+        self.samplesDrawn = 0
+        self.rejections = 0
+        self.queries = 0
+        self.queryTime = 0.0
+        self.lastQueryTime = 0.0
+        self.lastEffectiveSamples = 0.0
+
+    def startQuery(self):
+        """Marks the start of a query, returning the start time to pass to
+        endQuery"""
+        return time.perf_counter()
+
+    def endQuery(self, start):
+        """Marks the end of a query that began at the given time"""
+        elapsed = time.perf_counter() - start
+        self.queries += 1
+        self.queryTime += elapsed
+        self.lastQueryTime = elapsed
+
+    def averageQueryTime(self):
+        """Returns the mean time per query, in seconds"""
+        if self.queries == 0:
+            return 0.0
+        return self.queryTime / self.queries
+
+    def asDict(self):
+        """Returns the counters as a dictionary"""
+        return {"cptLookups": self.cptLookups,
+                "recursionNodes": self.recursionNodes,
+                "samplesDrawn": self.samplesDrawn,
+                "rejections": self.rejections,
+                "queries": self.queries,
+                "queryTime": self.queryTime,
+                "lastQueryTime": self.lastQueryTime,
+                "lastEffectiveSamples": self.lastEffectiveSamples,
+                "averageQueryTime": self.averageQueryTime()}
+
+    def __repr__(self):
+        return "QueryStats(" + str(self.asDict()) + ")"
+
+
+# ======================================================================
+# A tracer is any function called as tracer(event, **details). BayesNet only
+# builds the details when a tracer is installed, so tracing costs nothing
+# when it is off. The events are:
+#   "node"      readBayesNet read a node (node, values)
+#   "edge"      readBayesNet read an edge (fromNode, toNode)
+#   "cptRow"    readBayesNet read a CPT row (node, givens, probs)
+#   "visit"     recComputProb reached a node (node, depth)
+#   "known"     the node's value is known (node, value, prob, depth)
+#   "branch"    summing over an unknown node's value (node, value, prob, depth)
+#   "sumDone"   finished summing over an unknown node (node, prob, depth)
+#   "anytime"   anytimeSampling finished a batch (node, probs,
+#               effectiveSamples, samplesDrawn)
+#   "importance" adaptiveImportanceSampling finished a learning round
+#               (node, round, effectiveSamples, samplesDrawn)
+
+def printTracer(event, **details):
+    """A tracer that prints each event on its own line, indented by the
+    recursion depth, much like the old debugging output"""
+    depth = details.pop("depth", 0)
+    parts = [str(key) + "=" + str(details[key]) for key in details]
+    print("   " * depth, event, " ".join(parts))
+
+
+class RecordingTracer:
+    """A tracer that keeps every event in a list, as (event, details)
+    pairs, so a trace can be examined after the fact"""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event, **details):
+        self.events.append((event, details))
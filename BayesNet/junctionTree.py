@@ -0,0 +1,352 @@
+""" Defines a junction tree (clique tree) compiled from a list of factors, which
+answers repeated queries against the same network by message passing"""
+
+import math
+
+from BayesNet.factors import Factor, multiplyAll, tableSize
+from BayesNet.variableElimination import eliminationOrder, interactionGraph
+
+
+class JunctionTree:
+    """A junction tree is built once from the factors of a network. Each
+    clique holds the product of the factors assigned to it, and evidence is
+    entered as indicator factors on the clique that owns the evidence
+    variable. Calibrating the tree sends one message in each direction along
+    every edge (Shafer-Shenoy style: the clique potentials are never
+    overwritten), after which the posterior marginal of every variable can
+    be read off its clique. Messages are cached, and when one observation is
+    added or retracted only the messages flowing away from its clique are
+    recomputed."""
+
+    def __init__(self, factors, heuristic="min-fill"):
+        """Takes in a list of factors (typically one per CPT) and an
+        elimination-order heuristic used to triangulate the network"""
+        graph, self.cards = interactionGraph(factors)
+        self.variables = list(graph.keys())
+        order = eliminationOrder(factors, self.variables, heuristic)
+        self._buildCliques(graph, order)
+        self._buildSchedule()
+        self._assignFactors(factors)
+        self.evidence = {}
+        self.messages = {}
+        self.messageLogScales = {}
+        self.beliefs = {}
+
+
+    def _buildCliques(self, graph, order):
+        """Simulates eliminating the variables in the given order. Eliminating
+        a variable forms a clique of it and its current neighbors, which is
+        linked to the clique of the first of those neighbors to be eliminated
+        later. Cliques contained in a neighboring clique are then merged
+        into that neighbor, leaving a tree of maximal cliques."""
+        graph = {var: set(graph[var]) for var in graph}
+        position = {var: i for i, var in enumerate(order)}
+        cliqueOf = {}
+        adjacent = {}
+        for var in order:
+            neighbors = graph.pop(var)
+            cliqueOf[var] = set(neighbors)
+            cliqueOf[var].add(var)
+            adjacent[var] = set()
+            for n in neighbors:
+                graph[n].discard(var)
+                graph[n].update(neighbors)
+                graph[n].discard(n)
+        for var in order:
+            rest = [n for n in cliqueOf[var] if n != var]
+            if rest != []:
+                parent = min(rest, key=lambda n: position[n])
+                adjacent[var].add(parent)
+                adjacent[parent].add(var)
+
+        # Merge each non-maximal clique into a neighbor that contains it
+        owner = {var: var for var in order}
+        for var in order:
+            for other in adjacent[var]:
+                if cliqueOf[var] <= cliqueOf[other]:
+                    for n in adjacent[var]:
+                        adjacent[n].discard(var)
+                        if n != other:
+                            adjacent[n].add(other)
+                            adjacent[other].add(n)
+                    del adjacent[var]
+                    del cliqueOf[var]
+                    owner[var] = other
+                    break
+
+        # Number the surviving cliques, and join separate components with
+        # empty separators so that the whole network forms a single tree
+        ids = {}
+        for var in order:
+            if var in cliqueOf:
+                ids[var] = len(ids)
+        self.cliques = [None] * len(ids)
+        self.neighbors = [[] for i in range(len(ids))]
+        for var in ids:
+            members = sorted(cliqueOf[var], key=lambda v: position[v])
+            self.cliques[ids[var]] = members
+            for n in adjacent[var]:
+                self.neighbors[ids[var]].append(ids[n])
+        self._joinComponents()
+
+        self.homeClique = {}
+        for var in order:
+            root = owner[var]
+            while owner[root] != root:
+                root = owner[root]
+            owner[var] = root
+            self.homeClique[var] = ids[root]
+
+
+    def _joinComponents(self):
+        """Links the connected components into a chain, the first clique of
+        each one to the first clique of the one before. (Hanging them all off
+        clique 0 instead would give it one neighbor per component, and every
+        message it sends multiplies all of its other incoming messages.)"""
+        seen = set()
+        previous = None
+        for start in range(len(self.cliques)):
+            if start in seen:
+                continue
+            if previous is not None:
+                self.neighbors[previous].append(start)
+                self.neighbors[start].append(previous)
+            previous = start
+            stack = [start]
+            seen.add(start)
+            while stack != []:
+                c = stack.pop()
+                for n in self.neighbors[c]:
+                    if n not in seen:
+                        seen.add(n)
+                        stack.append(n)
+
+
+    def _buildSchedule(self):
+        """Roots the tree at clique 0 and records the order in which messages
+        are sent: the collect pass moves from the leaves toward the root, and
+        the distribute pass moves from the root back out to the leaves"""
+        self.parent = [None] * len(self.cliques)
+        preorder = []
+        if self.cliques != []:
+            stack = [0]
+            visited = set([0])
+            while stack != []:
+                c = stack.pop()
+                preorder.append(c)
+                for n in self.neighbors[c]:
+                    if n not in visited:
+                        visited.add(n)
+                        self.parent[n] = c
+                        stack.append(n)
+        self.collectOrder = [(c, self.parent[c]) for c in reversed(preorder)
+                             if self.parent[c] is not None]
+        self.distributeOrder = [(p, c) for (c, p) in reversed(self.collectOrder)]
+        self.separators = {}
+        for (c, p) in self.collectOrder:
+            sep = [v for v in self.cliques[c] if v in self.cliques[p]]
+            self.separators[(c, p)] = sep
+            self.separators[(p, c)] = sep
+
+
+    def _assignFactors(self, factors):
+        """Multiplies each factor into a clique that covers its scope. The
+        clique owning the first-eliminated variable of a factor's scope always
+        contains the whole scope."""
+        assigned = [[] for c in self.cliques]
+        for factor in factors:
+            if factor.variables == []:
+                assigned[0].append(factor)
+                continue
+            scope = set(factor.variables)
+            for var in factor.variables:
+                c = self.homeClique[var]
+                if scope <= set(self.cliques[c]):
+                    assigned[c].append(factor)
+                    break
+            else:
+                for c in range(len(self.cliques)):
+                    if scope <= set(self.cliques[c]):
+                        assigned[c].append(factor)
+                        break
+        self.potentials = []
+        for c, members in enumerate(self.cliques):
+            cards = [self.cards[var] for var in members]
+            unit = Factor(members, cards, [1.0] * tableSize(cards))
+            self.potentials.append(multiplyAll(assigned[c] + [unit]))
+
+
+    # ======================================================================
+    # Evidence. Each evidence variable lives in its home clique. Changing it
+    # only invalidates the messages that flow away from that clique; every
+    # other cached message stays valid and is reused.
+
+    def setEvidence(self, var, value):
+        """Sets (or changes) the value index observed for one variable"""
+        if self.evidence.get(var) != value:
+            self.evidence[var] = value
+            self._evidenceChanged(var)
+
+
+    def retractEvidence(self, var):
+        """Removes the observation of one variable, if there is one"""
+        if var in self.evidence:
+            del self.evidence[var]
+            self._evidenceChanged(var)
+
+
+    def updateEvidence(self, evidence):
+        """Changes the tree's evidence to the given dictionary of variables
+        and value indices, touching only the variables whose observations
+        differ from the current ones"""
+        for var in list(self.evidence):
+            if var not in evidence:
+                self.retractEvidence(var)
+        for var in evidence:
+            self.setEvidence(var, evidence[var])
+
+
+    def _evidenceChanged(self, var):
+        """Throws away the messages and beliefs that depend on the evidence
+        at var's home clique: every message directed away from that clique.
+        A message that is already missing has no cached messages depending on
+        it, so the search stops there."""
+        home = self.homeClique[var]
+        self.beliefs.pop(home, None)
+        stack = [(home, n) for n in self.neighbors[home]]
+        while stack != []:
+            (src, dest) = stack.pop()
+            if (src, dest) not in self.messages:
+                continue
+            del self.messages[(src, dest)]
+            del self.messageLogScales[(src, dest)]
+            self.beliefs.pop(dest, None)
+            for n in self.neighbors[dest]:
+                if n != src:
+                    stack.append((dest, n))
+
+
+    # ======================================================================
+    # Message passing. Messages are computed on demand and cached, so asking
+    # for one marginal only sends the messages into that variable's clique.
+
+    def calibrate(self, evidence):
+        """Given a dictionary mapping evidence variables to value indices,
+        sends every message needed so that all clique beliefs reflect the
+        evidence. Only messages affected by changed evidence are resent, so
+        calibrating twice with the same evidence does no work."""
+        self.updateEvidence(evidence)
+        for (src, dest) in self.collectOrder + self.distributeOrder:
+            if (src, dest) not in self.messages:
+                self._sendMessage(src, dest)
+
+
+    def _ensureIncoming(self, c):
+        """Makes sure every message into clique c has been computed, working
+        outward from c to find the missing ones and then sending them from
+        the outside in"""
+        needed = []
+        stack = [(n, c) for n in self.neighbors[c]]
+        while stack != []:
+            (src, dest) = stack.pop()
+            if (src, dest) in self.messages:
+                continue
+            needed.append((src, dest))
+            for n in self.neighbors[src]:
+                if n != dest:
+                    stack.append((n, src))
+        for (src, dest) in reversed(needed):
+            self._sendMessage(src, dest)
+
+
+    def _evidenceFactors(self, c):
+        """Returns the list of indicator factors for the evidence variables
+        owned by clique c"""
+        indicators = []
+        for var in self.cliques[c]:
+            if var in self.evidence and self.homeClique[var] == c:
+                indicator = [0.0] * self.cards[var]
+                indicator[self.evidence[var]] = 1.0
+                indicators.append(Factor([var], [self.cards[var]], indicator))
+        return indicators
+
+
+    def _sendMessage(self, src, dest):
+        """Computes the message from clique src to clique dest: the product
+        of src's potential and the messages src received from its other
+        neighbors, summed down to the separator. Messages are normalized to
+        avoid underflow on large networks; the scale is kept in log space.
+        The small evidence and message factors are multiplied together
+        before the clique's potential, so the full-size clique table is only
+        built once."""
+        incoming = [self.messages[(n, src)] for n in self.neighbors[src] if n != dest]
+        product = multiplyAll([self.potentials[src]] + self._evidenceFactors(src) + incoming)
+        sep = self.separators[(src, dest)]
+        for var in self.cliques[src]:
+            if var not in sep:
+                product = product.sumOut(var)
+        total = product.total()
+        if total > 0.0:
+            product = Factor(product.variables, product.cards,
+                             [p / total for p in product.table])
+            self.messageLogScales[(src, dest)] = math.log(total)
+        else:
+            self.messageLogScales[(src, dest)] = float("-inf")
+        self.messages[(src, dest)] = product
+
+
+    def belief(self, c):
+        """Returns the (unnormalized) belief of a calibrated clique: its
+        potential times all of its incoming messages"""
+        if c not in self.beliefs:
+            self._ensureIncoming(c)
+            incoming = [self.messages[(n, c)] for n in self.neighbors[c]]
+            self.beliefs[c] = multiplyAll([self.potentials[c]] + self._evidenceFactors(c) + incoming)
+        return self.beliefs[c]
+
+
+    def marginal(self, var):
+        """Returns the posterior distribution of a variable given the current
+        evidence, as a list of probabilities indexed by value position"""
+        c = self.homeClique[var]
+        result = self.belief(c)
+        for other in self.cliques[c]:
+            if other != var:
+                result = result.sumOut(other)
+        total = result.total()
+        if total == 0.0:
+            return result.table[:]
+        return [p / total for p in result.table]
+
+
+    def marginals(self):
+        """Returns a dictionary mapping every variable to its posterior
+        distribution, computing each clique's belief only once"""
+        return {var: self.marginal(var) for var in self.variables}
+
+
+    def posteriors(self, evidence, variables=None):
+        """Calibrates the tree with the given evidence, which is one collect
+        sweep toward the root and one distribute sweep back out (like the
+        forward and backward passes over a chain), and returns a dictionary
+        mapping each of the given variables (by default every variable
+        without evidence) to its posterior distribution"""
+        self.calibrate(evidence)
+        if variables is None:
+            variables = [var for var in self.variables if var not in evidence]
+        return {var: self.marginal(var) for var in variables}
+
+
+    def evidenceProbability(self):
+        """Returns the probability of the evidence the tree was calibrated
+        with, recovered from the root's belief and the collect-pass message
+        scales"""
+        if self.cliques == []:
+            return 1.0
+        self._ensureIncoming(0)
+        logProb = 0.0
+        for (src, dest) in self.collectOrder:
+            logProb += self.messageLogScales[(src, dest)]
+        if logProb == float("-inf"):
+            return 0.0
+        return self.belief(0).total() * math.exp(logProb)
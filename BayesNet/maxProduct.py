@@ -0,0 +1,106 @@
+""" Implements most-probable-explanation (MPE) and partial maximum a posteriori
+(MAP) queries by max-product variable elimination over lists of factors"""
+
+import heapq
+
+from BayesNet.factors import Factor, multiplyAll
+from BayesNet.variableElimination import eliminateVariables, eliminationOrder
+
+
+def maxProduct(factors, mapVars, evidence, heuristic="min-fill", excluded=None):
+    """Takes a list of factors, a list of MAP variables, a dictionary mapping
+    evidence variables to value indices and, optionally, a dictionary mapping
+    MAP variables to sets of value indices they may not take. Every other
+    variable is summed out first, then the MAP variables are maxed out one
+    at a time, keeping each one's bucket so that the best values can be read
+    back in reverse elimination order. Returns a pair of the best assignment
+    (a dictionary of MAP variables to value indices) and its joint
+    probability with the evidence, or None if every assignment has
+    probability zero. With every non-evidence variable in mapVars this is
+    an MPE query."""
+    reduced = [factor.reduce(evidence) for factor in factors]
+    mapVars = [var for var in mapVars if var not in evidence]
+    if excluded is not None:
+        cards = {}
+        for factor in reduced:
+            cards.update(zip(factor.variables, factor.cards))
+        for var in excluded:
+            indicator = [0.0 if v in excluded[var] else 1.0 for v in range(cards[var])]
+            reduced.append(Factor([var], [cards[var]], indicator))
+    mapSet = set(mapVars)
+    hidden = []
+    seen = set(mapSet)
+    for factor in reduced:
+        for var in factor.variables:
+            if var not in seen:
+                seen.add(var)
+                hidden.append(var)
+    remaining = eliminateVariables(reduced, eliminationOrder(reduced, hidden, heuristic))
+
+    buckets = []
+    for var in eliminationOrder(remaining, mapVars, heuristic):
+        bucket = []
+        rest = []
+        for factor in remaining:
+            if var in factor.variables:
+                bucket.append(factor)
+            else:
+                rest.append(factor)
+        product = multiplyAll(bucket)
+        buckets.append((var, product))
+        rest.append(product._marginalize(var, True))
+        remaining = rest
+    score = multiplyAll(remaining).table[0]
+    if score <= 0.0:
+        return None
+
+    assignment = {}
+    for (var, product) in reversed(buckets):
+        bestValue = 0
+        bestScore = float("-inf")
+        for v in range(product.cardOf(var)):
+            assignment[var] = v
+            entry = product.value(assignment)
+            if entry > bestScore:
+                bestValue = v
+                bestScore = entry
+        assignment[var] = bestValue
+    return assignment, score
+
+
+def topMaxProduct(factors, mapVars, evidence, k, heuristic="min-fill"):
+    """Like maxProduct, but returns a list of up to k (assignment,
+    probability) pairs, best first, leaving out assignments of probability
+    zero. After the best assignment is found, the rest of its part of the
+    search space is split (Lawler's method) into disjoint parts, one per
+    MAP variable: the earlier variables keep their values, this one must
+    take a different value, and the later ones are free. The best assignment
+    of each part is found by maxProduct with extra evidence and excluded
+    values, and a heap picks the next best overall. Each answer after the
+    first costs one maxProduct run per MAP variable."""
+    mapVars = [var for var in mapVars if var not in evidence]
+    results = []
+    first = maxProduct(factors, mapVars, evidence, heuristic)
+    if first is None:
+        return results
+    counter = 0
+    heap = [(-first[1], counter, first[0], {}, {})]
+    while heap != [] and len(results) < k:
+        (negScore, c, assignment, fixed, excluded) = heapq.heappop(heap)
+        full = dict(fixed)
+        full.update(assignment)
+        results.append((full, -negScore))
+        free = [var for var in mapVars if var not in fixed]
+        prefix = dict(fixed)
+        for var in free:
+            partExcluded = {v: set(excluded[v]) for v in excluded if v not in prefix}
+            partExcluded.setdefault(var, set()).add(full[var])
+            partEvidence = dict(evidence)
+            partEvidence.update(prefix)
+            best = maxProduct(factors, [v for v in free if v not in prefix],
+                              partEvidence, heuristic, partExcluded)
+            if best is not None:
+                counter += 1
+                heapq.heappush(heap, (-best[1], counter, best[0], dict(prefix), partExcluded))
+            prefix[var] = full[var]
+    return results
@@ -0,0 +1,114 @@
+""" Builds synthetic Bayesian networks and queries for testing and
+benchmarking. Every generator takes a seed, so the same arguments always give
+the same network."""
+
+import random
+
+from BayesNet.bayesNetDef import BayesNet
+
+
+def randomNetwork(numNodes, arity=2, maxInDegree=3, window=None, seed=None,
+                  cptBackend="dict", cacheSize=0):
+    """Builds a random DAG over nodes X0, X1, ... with random CPTs. Each node
+    gets up to maxInDegree parents, chosen from the window nodes just before
+    it (from all earlier nodes if window is None). Since every edge, and so
+    every edge added by moralizing, joins two nodes at most window apart,
+    the window is also a bound on the treewidth, which is what makes exact
+    inference hard. The arity is either the number of values of every node
+    or a (low, high) pair to pick each node's number of values from. Each
+    CPT row is drawn uniformly from the probability simplex"""
+    rand = random.Random(seed)
+    network = BayesNet(cptBackend, cacheSize)
+    names = ["X" + str(i) for i in range(numNodes)]
+    for name in names:
+        if isinstance(arity, tuple):
+            card = rand.randint(arity[0], arity[1])
+        else:
+            card = arity
+        network.addNode(name, ["v" + str(v) for v in range(card)])
+    for i in range(1, numNodes):
+        first = 0 if window is None else max(0, i - window)
+        candidates = list(range(first, i))
+        numParents = rand.randint(0, min(maxInDegree, len(candidates)))
+        for p in sorted(rand.sample(candidates, numParents)):
+            network.addEdge(names[p], names[i])
+    network.setOrdering()
+    network.setupCPTables()
+    for name in names:
+        values = network.nodeValues[name]
+        for givens in network.buildGivens(name):
+            # Normalized exponentials are uniform over the simplex
+            weights = [rand.expovariate(1.0) for value in values]
+            total = sum(weights)
+            for value, weight in zip(values, weights):
+                network.addCPTableValue(name, value, givens, weight / total)
+    return network
+
+
+def wumpusGrid(rows, cols, pitProb=0.2, falseBreeze=0.0, missedBreeze=0.0,
+               cptBackend="dict", cacheSize=0):
+    """Builds the network for finding pits in a Wumpus-style dungeon of rows
+    by cols cells. Each cell has a node isPit_r_c, which is "yes" with
+    probability pitProb, and a node breezeAt_r_c whose parents are the pit
+    nodes of the cells next to it. With no pit next door a breeze is felt
+    with probability falseBreeze, and each pit next door makes a breeze
+    except with probability missedBreeze, so with both at 0.0 the breeze is
+    exactly the OR of the neighboring pits"""
+    network = BayesNet(cptBackend, cacheSize)
+    cells = [(r, c) for r in range(rows) for c in range(cols)]
+    for (r, c) in cells:
+        network.addNode(_cellName("isPit", r, c), ["yes", "no"])
+    for (r, c) in cells:
+        breeze = _cellName("breezeAt", r, c)
+        network.addNode(breeze, ["yes", "no"])
+        for (dr, dc) in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+            if 0 <= r + dr < rows and 0 <= c + dc < cols:
+                network.addEdge(_cellName("isPit", r + dr, c + dc), breeze)
+    network.setOrdering()
+    network.setupCPTables()
+    for (r, c) in cells:
+        pit = _cellName("isPit", r, c)
+        network.addCPTableValue(pit, "yes", (), pitProb)
+        network.addCPTableValue(pit, "no", (), 1.0 - pitProb)
+        breeze = _cellName("breezeAt", r, c)
+        for givens in network.buildGivens(breeze):
+            pits = givens.count("yes")
+            noBreeze = (1.0 - falseBreeze) * missedBreeze ** pits
+            network.addCPTableValue(breeze, "yes", givens, 1.0 - noBreeze)
+            network.addCPTableValue(breeze, "no", givens, noBreeze)
+    return network
+
+
+def _cellName(kind, r, c):
+    return kind + "_" + str(r) + "_" + str(c)
+
+
+def randomQueries(network, numQueries, numEvidence, seed=None, queryNodes=None, evidenceNodes=None):
+    """Builds a list of numQueries (query node, evidence dictionary) pairs.
+    The query node is picked from queryNodes and the evidence nodes from
+    evidenceNodes (all nodes by default), and the evidence values are taken
+    from a sample of the network's prior, so the evidence never has
+    probability zero"""
+    rand = random.Random(seed)
+    compiled = network.compile()
+    if queryNodes is None:
+        queryNodes = list(network.nodeOrder)
+    if evidenceNodes is None:
+        evidenceNodes = list(network.nodeOrder)
+    queries = []
+    for i in range(numQueries):
+        sample = compiled.decodeAssignment(compiled.sample(rand.random))
+        query = rand.choice(queryNodes)
+        candidates = [node for node in evidenceNodes if node != query]
+        chosen = rand.sample(candidates, min(numEvidence, len(candidates)))
+        queries.append((query, {node: sample[node] for node in chosen}))
+    return queries
+
+
+def wumpusQueries(network, numQueries, numEvidence, seed=None):
+    """Like randomQueries for a wumpusGrid network: the evidence is whether
+    a breeze was felt in some cells, and the query is whether some cell
+    holds a pit"""
+    pits = [node for node in network.nodeOrder if node.startswith("isPit")]
+    breezes = [node for node in network.nodeOrder if node.startswith("breezeAt")]
+    return randomQueries(network, numQueries, numEvidence, seed, pits, breezes)
@@ -0,0 +1,190 @@
+""" Runs the vectorized samplers across a pool of worker processes. The samples
+are split into a fixed number of shards, each with its own seed stream
+spawned from one master seed, and the shards are then dealt out to however
+many workers there are, so the same seed gives the same result on any
+machine. Only aggregate counts or weight sums are sent back between
+processes. The compiled network is pickled to reach the workers, so a
+network that cannot be pickled (say, a deterministic node whose function is
+a lambda) is sampled in this process instead. On platforms that
+start workers by spawning a fresh interpreter, call these from inside an
+if __name__ == "__main__": block"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from BayesNet.compiledNet import picklable
+from BayesNet.vectorSampling import VectorTables, priorSampleColumns, likelihoodWeightColumns
+
+# Each shard is drawn in chunks of at most this many samples, so memory use
+# does not grow with the number of samples
+CHUNK_SIZE = 250000
+
+# The number of seeded shards the samples are split into (fewer if there are
+# fewer samples). It must not depend on the number of workers, or the result
+# for a seed would change from one machine to the next
+NUM_SHARDS = 64
+
+
+def shardSizes(numSamples, numShards):
+    """Splits numSamples as evenly as possible into numShards parts"""
+    base, extra = divmod(numSamples, numShards)
+    return [base + (1 if i < extra else 0) for i in range(numShards)]
+
+
+def chunkSizes(numSamples):
+    """Splits one shard of samples into chunks of at most CHUNK_SIZE
+    samples"""
+    sizes = []
+    while numSamples > 0:
+        sizes.append(min(numSamples, CHUNK_SIZE))
+        numSamples -= sizes[-1]
+    return sizes
+
+
+# ======================================================================
+# Shard functions. These run in the worker processes, so they are plain
+# module-level functions that take and return only simple, picklable data.
+# Each draws one shard's samples from its own seed sequence, given the
+# VectorTables its worker built once for all of its shards.
+
+def priorCountsShard(compiled, tables, numSamples, seedSeq):
+    """Draws prior samples and returns, for every node, the list of counts
+    of each of its value ids"""
+    rng = np.random.default_rng(seedSeq)
+    counts = [np.zeros(card, dtype=np.int64) for card in compiled.cards]
+    for size in chunkSizes(numSamples):
+        samples = priorSampleColumns(tables, size, rng)
+        for node in range(len(compiled)):
+            counts[node] += np.bincount(samples.columns[node], minlength=compiled.cards[node])
+    return [c.tolist() for c in counts]
+
+
+def rejectionShard(compiled, tables, queryNode, evidence, numSamples, seedSeq):
+    """Draws prior samples, keeps those consistent with the evidence, and
+    returns the counts of the query node's value ids among them"""
+    rng = np.random.default_rng(seedSeq)
+    counts = np.zeros(compiled.cards[queryNode], dtype=np.int64)
+    for size in chunkSizes(numSamples):
+        samples = priorSampleColumns(tables, size, rng)
+        keep = np.ones(size, dtype=bool)
+        for node in evidence:
+            keep &= samples.columns[node] == evidence[node]
+        counts += np.bincount(samples.columns[queryNode][keep],
+                              minlength=compiled.cards[queryNode])
+    return counts.tolist()
+
+
+def likelihoodShard(compiled, tables, queryNode, evidence, numSamples, seedSeq):
+    """Draws likelihood-weighted samples and returns the weight sums for
+    each of the query node's value ids. The sums are scaled by exp(-logScale)
+    to stay in floating-point range, so the result is (logScale, sums)."""
+    rng = np.random.default_rng(seedSeq)
+    logScale = float("-inf")
+    sums = np.zeros(compiled.cards[queryNode])
+    for size in chunkSizes(numSamples):
+        samples, logWeights = likelihoodWeightColumns(tables, evidence, size, rng)
+        chunkScale = logWeights.max()
+        if chunkScale == float("-inf"):
+            continue
+        chunkSums = np.bincount(samples.columns[queryNode], weights=np.exp(logWeights - chunkScale),
+                                minlength=compiled.cards[queryNode])
+        logScale, sums = mergeWeightSums(logScale, sums, chunkScale, chunkSums)
+    return logScale, sums.tolist()
+
+
+def mergeWeightSums(scale1, sums1, scale2, sums2):
+    """Adds together two scaled weight sums, returning the combined scale
+    and sums"""
+    if scale1 == float("-inf"):
+        return scale2, np.asarray(sums2, dtype=np.float64)
+    if scale2 == float("-inf"):
+        return scale1, np.asarray(sums1, dtype=np.float64)
+    top = max(scale1, scale2)
+    merged = (np.asarray(sums1) * math.exp(scale1 - top) +
+              np.asarray(sums2) * math.exp(scale2 - top))
+    return top, merged
+
+
+# ======================================================================
+# Running the workers
+
+def shardWorker(shardFunction, compiled, extraArgs, shards):
+    """Runs in a worker process: builds the VectorTables once and calls
+    shardFunction(compiled, tables, *extraArgs, shardSize, seedSeq) for each
+    of the given (shardSize, seedSeq) shards, returning their results"""
+    tables = VectorTables(compiled)
+    return [shardFunction(compiled, tables, *extraArgs, size, seedSeq)
+            for (size, seedSeq) in shards]
+
+
+def runSharded(shardFunction, compiled, extraArgs, numSamples, numWorkers=None, seed=None):
+    """Splits numSamples into NUM_SHARDS shards, each with a seed sequence
+    spawned from the master seed, deals them out in contiguous runs to
+    numWorkers processes (by default one per CPU), and runs shardFunction
+    on each. The shards and their seeds depend only on numSamples and the
+    seed, so the results are reproducible for a given seed whatever the
+    number of workers. If the compiled network cannot be pickled, every
+    shard is run in this process, which gives the same results, only
+    slower. Returns the shards' results, in shard order."""
+    numShards = max(1, min(NUM_SHARDS, numSamples))
+    seedSeqs = np.random.SeedSequence(seed).spawn(numShards)
+    shards = list(zip(shardSizes(numSamples, numShards), seedSeqs))
+    if numWorkers is None:
+        numWorkers = os.cpu_count() or 1
+    numWorkers = max(1, min(numWorkers, numShards))
+    if numWorkers > 1 and not picklable(compiled):
+        numWorkers = 1
+    if numWorkers == 1:
+        return shardWorker(shardFunction, compiled, extraArgs, shards)
+    starts = [0]
+    for size in shardSizes(numShards, numWorkers):
+        starts.append(starts[-1] + size)
+    with ProcessPoolExecutor(max_workers=numWorkers) as pool:
+        futures = [pool.submit(shardWorker, shardFunction, compiled, extraArgs, shards[start:end])
+                   for start, end in zip(starts, starts[1:])]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+
+def parallelPriorCounts(compiled, numSamples, numWorkers=None, seed=None):
+    """Returns, for every node id, the total counts of its value ids over
+    numSamples prior samples drawn in parallel"""
+    results = runSharded(priorCountsShard, compiled, (), numSamples, numWorkers, seed)
+    totals = [[0] * card for card in compiled.cards]
+    for result in results:
+        for node, counts in enumerate(result):
+            for v, c in enumerate(counts):
+                totals[node][v] += c
+    return totals
+
+
+def parallelRejection(compiled, queryNode, evidence, numSamples, numWorkers=None, seed=None):
+    """Returns the counts of the query node's value ids among the samples
+    consistent with the evidence, out of numSamples drawn in parallel"""
+    results = runSharded(rejectionShard, compiled, (queryNode, evidence),
+                         numSamples, numWorkers, seed)
+    totals = [0] * compiled.cards[queryNode]
+    for counts in results:
+        for v, c in enumerate(counts):
+            totals[v] += c
+    return totals
+
+
+def parallelLikelihood(compiled, queryNode, evidence, numSamples, numWorkers=None, seed=None):
+    """Returns the normalized weight sums of the query node's value ids over
+    numSamples likelihood-weighted samples drawn in parallel, or None if
+    every sample had zero weight"""
+    results = runSharded(likelihoodShard, compiled, (queryNode, evidence),
+                         numSamples, numWorkers, seed)
+    logScale = float("-inf")
+    sums = np.zeros(compiled.cards[queryNode])
+    for (workerScale, workerSums) in results:
+        logScale, sums = mergeWeightSums(logScale, sums, workerScale, workerSums)
+    if logScale == float("-inf"):
+        return None
+    return (sums / sums.sum()).tolist()
@@ -0,0 +1,196 @@
+""" Defines parametric conditional probability tables: noisy-OR, noisy-MAX and
+deterministic nodes. They store a few parameters per parent instead of one
+row per combination of parent values, and compute any row on demand. Each
+can be put in BayesNet.cpts in place of a table (see BayesNet.setNoisyOr,
+setNoisyMax and setDeterministic)."""
+
+from abc import abstractmethod
+
+from BayesNet.compiledNet import FlatView
+from BayesNet.cptBase import CPTBase
+from BayesNet.factors import Factor
+
+
+class ParametricCPT(CPTBase):
+    """The abstract base of every parametric CPT. A subclass only has to
+    compute the distribution of the node's values for one combination of
+    parent value positions (distributionOf). Lookups, rows, dictionary-style
+    access and full expansion are all built on that."""
+
+    # BayesNet.useCPTBackend leaves parametric CPTs alone
+    parametric = True
+
+    @abstractmethod
+    def distributionOf(self, parentIds):
+        """Given the position of each parent's value, returns the list of
+        probabilities of the node's values, which must sum to one"""
+
+
+    def rowAt(self, row):
+        return self.distributionOf(self.parentIdsOf(row))
+
+
+    def row(self, givens):
+        """Returns the list of probabilities of each of the node's values,
+        given a sequence of parent values"""
+        return self.distributionOf([index[given] for index, given in zip(self.parentIndex, givens)])
+
+
+    def rowsSumToOne(self, tolerance):
+        """Every row is a distribution by construction, so there is nothing
+        to check (and checking would build every row)"""
+        return True
+
+
+    def setValue(self, value, givens, prob):
+        raise ValueError("A parametric CPT is set by its parameters, not entry by entry")
+
+
+    def flatView(self):
+        """Returns a read-only, list-like view of the flat table (rows one
+        after another), whose rows are only computed when they are read.
+        A subclass with a factors method (like NoisyMax) gives the compiled
+        network its own decomposition in place of one factor over the view"""
+        return FlatView(self)
+
+
+class NoisyMax(ParametricCPT):
+    """A noisy-MAX node: its values are graded levels, and each parent value
+    independently pushes the node up to some level, with the node taking the
+    highest level it is pushed to. A leak term covers causes outside the
+    network. P(node <= level) is then the product of every parent's (and
+    the leak's) probability of staying at or below that level, so the CPT
+    needs one distribution per parent value rather than per row."""
+
+    def __init__(self, values, parentValues, levels, effects, leak=None):
+        """Takes in the node's values, the parents' values, the list of the
+        node's values from lowest to highest level, and, for each parent in
+        CPT order, a dictionary mapping some of its values to a list of the
+        probabilities of each level (lowest first) that value alone would
+        cause. Parent values left out have no effect. The leak is a list of
+        level probabilities too, and by default always gives the lowest"""
+        ParametricCPT.__init__(self, values, parentValues)
+        if sorted(levels) != sorted(self.values):
+            raise ValueError("The levels must be the node's values in order: " + str(levels))
+        numLevels = len(levels)
+        self.levels = list(levels)
+        self.levelOf = [self.levels.index(value) for value in self.values]
+        if leak is None:
+            leak = [1.0] + [0.0] * (numLevels - 1)
+        self.leak = list(leak)
+        self.leakCumulative = _cumulative(self.leak)
+        # effects[i][j] is the level distribution caused by value j of parent
+        # i, or None if that value has no effect
+        self.effects = []
+        self.cumulatives = []
+        for vals, effect in zip(self.parentValues, effects):
+            probs = [None] * len(vals)
+            cumulative = [None] * len(vals)
+            for j, val in enumerate(vals):
+                if val in effect:
+                    probs[j] = list(effect[val])
+                    cumulative[j] = _cumulative(probs[j])
+            self.effects.append(probs)
+            self.cumulatives.append(cumulative)
+
+
+    def distributionOf(self, parentIds):
+        cumulative = self.leakCumulative
+        for i, j in enumerate(parentIds):
+            parentCumulative = self.cumulatives[i][j]
+            if parentCumulative is not None:
+                cumulative = [a * b for a, b in zip(cumulative, parentCumulative)]
+        levelProbs = [cumulative[0]]
+        for k in range(1, len(cumulative)):
+            levelProbs.append(max(0.0, cumulative[k] - cumulative[k - 1]))
+        return [levelProbs[level] for level in self.levelOf]
+
+
+    def factors(self, parentVars, nodeVar):
+        """Decomposes the CPT into a chain of small factors, one per parent,
+        linked by auxiliary variables named (nodeVar, i): the i-th holds the
+        highest level caused by the leak and the first i parents, and the
+        last link is the node itself. Each factor covers one parent and two
+        levels, so the total size grows linearly with the number of parents
+        instead of exponentially."""
+        numLevels = len(self.levels)
+        card = len(self.values)
+        if parentVars == []:
+            return [Factor([nodeVar], [card], [self.leak[level] for level in self.levelOf])]
+        noEffect = [1.0] + [0.0] * (numLevels - 1)
+        previous = (nodeVar, 0)
+        factors = [Factor([previous], [numLevels], self.leak[:])]
+        for i, parent in enumerate(parentVars):
+            last = (i == len(parentVars) - 1)
+            if last:
+                current = nodeVar
+                outLevels = self.levelOf
+            else:
+                current = (nodeVar, i + 1)
+                outLevels = list(range(numLevels))
+            table = []
+            for before in range(numLevels):
+                for j in range(self.parentCards[i]):
+                    probs = self.effects[i][j] or noEffect
+                    for level in outLevels:
+                        if level > before:
+                            table.append(probs[level])
+                        elif level == before:
+                            table.append(sum(probs[:before + 1]))
+                        else:
+                            table.append(0.0)
+            factors.append(Factor([previous, parent, current],
+                                  [numLevels, self.parentCards[i], len(outLevels)], table))
+            previous = current
+        return factors
+
+
+class NoisyOr(NoisyMax):
+    """A noisy-OR node: a two-valued node that is "on" if any of its causes
+    turns it on. Each parent value that is a cause turns the node on with
+    its own probability, independently of the others, and the leak turns it
+    on with some probability even when no cause is present."""
+
+    def __init__(self, values, parentValues, onValue, causes, leak=0.0):
+        """Takes in the node's two values, the parents' values, which of the
+        node's values means "on", for each parent in CPT order a dictionary
+        mapping its cause values to the probability that they turn the node
+        on, and the leak probability"""
+        if len(values) != 2 or onValue not in values:
+            raise ValueError("A noisy-OR node needs two values, one of them " + str(onValue))
+        offValue = [value for value in values if value != onValue][0]
+        effects = [{val: [1.0 - prob, prob] for val, prob in cause.items()} for cause in causes]
+        NoisyMax.__init__(self, values, parentValues, [offValue, onValue], effects,
+                          [1.0 - leak, leak])
+
+
+class Deterministic(ParametricCPT):
+    """A node whose value is a fixed function of its parents' values. The
+    function is stored as given, so it must be picklable (a module-level
+    function, not a lambda or a nested function) for the network to be
+    sampled or batch-queried in parallel; otherwise those run in a single
+    process"""
+
+    def __init__(self, values, parentValues, function):
+        """Takes in the node's values, the parents' values, and a function
+        that is called with the parents' values (in CPT order) and returns
+        the node's value"""
+        ParametricCPT.__init__(self, values, parentValues)
+        self.function = function
+
+
+    def distributionOf(self, parentIds):
+        givens = [vals[i] for vals, i in zip(self.parentValues, parentIds)]
+        probs = [0.0] * len(self.values)
+        probs[self.valueIndex[self.function(*givens)]] = 1.0
+        return probs
+
+
+def _cumulative(probs):
+    """Returns the running totals of a list of probabilities"""
+    totals = []
+    total = 0.0
+    for prob in probs:
+        total += prob
+        totals.append(total)
+    return totals
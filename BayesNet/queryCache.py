@@ -0,0 +1,56 @@
+""" Defines a bounded least-recently-used cache for query results"""
+
+from collections import OrderedDict
+
+
+class QueryCache:
+    """Remembers the results of recent queries, keyed on the query node and
+    a frozen copy of the evidence. Once it holds maxSize results, storing a
+    new one evicts the least recently used. It counts its hits and misses so
+    that its usefulness can be checked."""
+
+    def __init__(self, maxSize=128):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def makeKey(self, node, evidence):
+        """Builds the cache key for a query: the node plus the evidence as a
+        frozenset of (node, value) pairs, so the order in which the evidence
+        was given does not matter. Evidence about the query node itself is
+        left out, since it does not change the answer"""
+        return (node, frozenset((n, v) for (n, v) in evidence.items() if n != node))
+
+    def lookup(self, key):
+        """Returns the cached result for the key, or None if there is none"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, key, result):
+        """Adds a result to the cache, evicting the oldest one if it is full"""
+        if self.maxSize <= 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Throws away every cached result (the statistics are kept)"""
+        self.entries.clear()
+
+    def stats(self):
+        """Returns a dictionary with the number of hits and misses, the hit
+        rate, and the current and maximum size"""
+        total = self.hits + self.misses
+        if total == 0:
+            hitRate = 0.0
+        else:
+            hitRate = self.hits / total
+        return {"hits": self.hits, "misses": self.misses, "hitRate": hitRate,
+                "size": len(self.entries), "maxSize": self.maxSize}
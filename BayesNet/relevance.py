@@ -0,0 +1,118 @@
+""" Finds the part of a network that is relevant to a query, so that inference
+can run on a smaller network. Two kinds of nodes are dropped:
+  - barren nodes: nodes that are neither the query, nor evidence, nor an
+    ancestor of either. Summing them out always gives 1.
+  - d-separated nodes: once the evidence nodes are removed from the moral
+    graph of what is left, only the query's connected component matters.
+    Every other CPT contributes a constant factor, which normalization
+    removes.
+An evidence node that is kept only because a CPT in the query's component
+mentions it becomes a root with a uniform distribution, since its own CPT
+would be one of those constant factors. Both rules assume that every row of
+every CPT sums to one, which cptsSumToOne checks."""
+
+# How far a CPT row's total may be from one for pruning to still be safe
+ROW_SUM_TOLERANCE = 1e-6
+
+
+def cptsSumToOne(network, tolerance=ROW_SUM_TOLERANCE):
+    """Returns whether every row of every CPT in the network adds up to one,
+    to within the tolerance. Entries missing from a nested-dictionary CPT
+    count as zero"""
+    for node in network.nodeList:
+        table = network.cpts.get(node)
+        if table is None:
+            continue
+        if not isinstance(table, dict):
+            if not table.rowsSumToOne(tolerance):
+                return False
+            continue
+        totals = {}
+        for value in table:
+            for givens, prob in table[value].items():
+                totals[givens] = totals.get(givens, 0.0) + prob
+        for total in totals.values():
+            if abs(total - 1.0) > tolerance:
+                return False
+    return True
+
+
+def ancestralSet(network, nodes):
+    """Returns the set of the given nodes and all of their ancestors"""
+    result = set(nodes)
+    stack = list(nodes)
+    while stack != []:
+        node = stack.pop()
+        for parent in network.revEdges[node]:
+            if parent not in result:
+                result.add(parent)
+                stack.append(parent)
+    return result
+
+
+def moralNeighbors(network, node, within):
+    """Yields the neighbors of a node in the moral graph of the subnetwork
+    made of the nodes in within, which must be closed under taking parents:
+    its parents, its children, and its children's other parents"""
+    for parent in network.revEdges[node]:
+        yield parent
+    for child in network.edges[node]:
+        if child in within:
+            yield child
+            for parent in network.revEdges[child]:
+                if parent != node:
+                    yield parent
+
+
+def requisiteNodes(network, query, evidenceVars):
+    """Given a query node (or None, when the query is the probability of the
+    evidence itself) and a set of evidence nodes, returns a pair of sets: the
+    nodes whose CPTs are needed, and the evidence nodes that appear in those
+    CPTs but whose own CPTs are not needed. With no query only the barren
+    nodes are dropped, since the probability of the evidence depends on
+    every one of its ancestors"""
+    relevant = ancestralSet(network, [n for n in [query] if n is not None] + list(evidenceVars))
+    if query is None:
+        return relevant, set()
+    component = set([query])
+    stack = [query]
+    while stack != []:
+        node = stack.pop()
+        for n in moralNeighbors(network, node, relevant):
+            if n not in evidenceVars and n not in component:
+                component.add(n)
+                stack.append(n)
+    needed = set(component)
+    for node in component:
+        for child in network.edges[node]:
+            if child in evidenceVars:
+                needed.add(child)
+    boundary = set()
+    for node in needed:
+        for parent in network.revEdges[node]:
+            if parent not in needed:
+                boundary.add(parent)
+    return needed, boundary
+
+
+def prunedNetwork(network, query, evidenceVars):
+    """Builds a new network holding only the part of the given network that
+    is relevant to P(query | evidenceVars). The kept nodes share their CPT
+    tables with the original network, so nothing is copied. Pruning is
+    turned off in the new network"""
+    needed, boundary = requisiteNodes(network, query, evidenceVars)
+    pruned = network.__class__(network.cptBackend, 0)
+    pruned.pruning = False
+    for node in network.nodeList:
+        if node in needed or node in boundary:
+            pruned.addNode(node, network.nodeValues[node])
+    for node in network.nodeList:
+        if node in needed:
+            for parent in network.revEdges[node]:
+                pruned.addEdge(parent, node)
+            pruned.cpts[node] = network.cpts[node]
+        elif node in boundary:
+            values = network.nodeValues[node]
+            pruned.cpts[node] = {value: {(): 1.0 / len(values)} for value in values}
+    pruned.setOrdering()
+    return pruned
@@ -0,0 +1,122 @@
+""" Reads and writes compiled BayesNet snapshots: a versioned binary file
+holding the interned names, the topology and the CPT arrays, laid out so
+that it can be memory-mapped and used without any text parsing.
+
+The file starts with a fixed header:
+    magic       8 bytes   b"BNSNAP\\0\\0"
+    version     uint32
+    numNodes    uint32
+    then six (offset, length) pairs of uint64, giving the byte ranges of
+    the sections below, in this order:
+    names       UTF-8 strings separated by NUL bytes: for each node (in
+                topological order) its name followed by its values
+    cards       int32[numNodes], the number of values of each node
+    parentCounts int32[numNodes], the number of parents of each node
+    parents     int32[], every node's parent ids (in CPT order), one node
+                after another
+    tableStarts int64[numNodes + 1], where each node's CPT starts within
+                the table section (counted in entries, not bytes)
+    tables      float64[], every node's flat CPT, one after another
+Every section starts on an 8-byte boundary. All numbers are little-endian."""
+
+import struct
+
+import numpy as np
+
+MAGIC = b"BNSNAP\0\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII12Q")
+
+# A lazy CPT (sparse or parametric) is only expanded into a snapshot without
+# being asked if its full table has at most this many entries (8 MB)
+MAX_EXPANDED_ENTRIES = 1 << 20
+
+
+def _align(offset):
+    """Rounds an offset up to the next multiple of 8"""
+    return (offset + 7) & ~7
+
+
+def writeSnapshot(compiled, filename, expand=False):
+    """Writes a CompiledNet to the given file. The format only holds full
+    tables, so a CPT kept as a lazy FlatView (a sparse or parametric CPT)
+    has every one of its rows built and written out. That can be far larger
+    than the CPT itself, so a lazy CPT of more than MAX_EXPANDED_ENTRIES
+    entries raises a ValueError unless expand is True"""
+    if not expand:
+        for node in range(len(compiled)):
+            table = compiled.tables[node]
+            if hasattr(table, "rowProbs") and len(table) > MAX_EXPANDED_ENTRIES:
+                raise ValueError("Snapshot would expand the lazy CPT of " +
+                                 str(compiled.nodeNames[node]) + " into " +
+                                 str(len(compiled.tables[node])) +
+                                 " entries; pass expand=True to write it anyway")
+    names = []
+    for node in range(len(compiled)):
+        names.append(compiled.nodeNames[node])
+        names.extend(str(v) for v in compiled.values[node])
+    sections = [
+        "\0".join(names).encode("utf-8"),
+        np.asarray(compiled.cards, dtype="<i4").tobytes(),
+        np.asarray([len(ps) for ps in compiled.parents], dtype="<i4").tobytes(),
+        np.asarray([p for ps in compiled.parents for p in ps], dtype="<i4").tobytes(),
+        np.cumsum([0] + [len(t) for t in compiled.tables], dtype="<i8").tobytes(),
+        np.concatenate([np.asarray(t, dtype="<f8") for t in compiled.tables] +
+                       [np.zeros(0, dtype="<f8")]).tobytes(),
+    ]
+    ranges = []
+    offset = _align(HEADER.size)
+    for data in sections:
+        ranges.extend([offset, len(data)])
+        offset = _align(offset + len(data))
+    with open(filename, "wb") as fileObj:
+        fileObj.write(HEADER.pack(MAGIC, VERSION, len(compiled), *ranges))
+        for i, data in enumerate(sections):
+            fileObj.seek(ranges[2 * i])
+            fileObj.write(data)
+        fileObj.truncate(offset)
+
+
+def readSnapshot(filename):
+    """Memory-maps a snapshot file and returns its contents as a tuple of
+    (node names, values per node, parent ids per node, CPT array per node).
+    Each CPT is a (rows x values) view into the mapped file, opened
+    copy-on-write, so nothing is read until it is used and changing a table
+    never changes the file."""
+    mapped = np.memmap(filename, dtype=np.uint8, mode="c")
+    if len(mapped) < HEADER.size:
+        raise ValueError("Not a BayesNet snapshot: " + str(filename))
+    fields = HEADER.unpack(mapped[:HEADER.size].tobytes())
+    magic, version, numNodes = fields[:3]
+    if magic != MAGIC:
+        raise ValueError("Not a BayesNet snapshot: " + str(filename))
+    if version != VERSION:
+        raise ValueError("Unsupported BayesNet snapshot version: " + str(version))
+    ranges = fields[3:]
+
+    def section(i, dtype):
+        start, length = ranges[2 * i], ranges[2 * i + 1]
+        return mapped[start:start + length].view(dtype)
+
+    cards = section(1, "<i4").tolist()
+    parentCounts = section(2, "<i4").tolist()
+    allParents = section(3, "<i4").tolist()
+    tableStarts = section(4, "<i8").tolist()
+    tables = section(5, "<f8")
+
+    strings = section(0, np.uint8).tobytes().decode("utf-8").split("\0")
+    nodeNames = []
+    values = []
+    pos = 0
+    parents = []
+    parentPos = 0
+    cpts = []
+    for node in range(numNodes):
+        nodeNames.append(strings[pos])
+        values.append(strings[pos + 1:pos + 1 + cards[node]])
+        pos += 1 + cards[node]
+        parents.append(allParents[parentPos:parentPos + parentCounts[node]])
+        parentPos += parentCounts[node]
+        table = tables[tableStarts[node]:tableStarts[node + 1]]
+        cpts.append(table.reshape(-1, cards[node]))
+    return nodeNames, values, parents, cpts
@@ -0,0 +1,136 @@
+""" Defines the sparse CPT backend, which stores only the entries that differ
+from a default instead of one number per (value, parent values) cell"""
+
+from BayesNet.compiledNet import FlatView
+from BayesNet.cptBase import CPTBase
+from BayesNet.factors import tableSize
+
+
+class SparseCPT(CPTBase):
+    """Stores the CPT of one node as a map from rows to their explicit
+    entries, plus a default probability for every entry that is not listed.
+    Each row can have its own default (setRowDefault), and rows without one
+    use the table's default, which starts out as 0.0. Rows are numbered by
+    the mixed-radix code of the parents' value positions, as in TensorCPT.
+    Rows are built from the explicit entries each time they are read and
+    are never kept, so memory grows only with the explicit entries, not
+    with the size of the table or the number of rows read. Indexing with
+    cpt[value][givens] works just like the nested dictionaries.
+
+    Once a SparseCPT is in BayesNet.cpts, change its defaults through
+    BayesNet.setCPTRowDefault and setCPTDefault, which also clear the
+    network's compiled structures and cached answers."""
+
+    backend = "sparse"
+
+    def __init__(self, values, parentValues, default=0.0):
+        """Takes in the list of the node's values, a list holding the list of
+        values for each parent, in CPT order, and the probability of every
+        entry that is never set"""
+        CPTBase.__init__(self, values, parentValues)
+        self.default = default
+        self.rowDefaults = {}
+        self.entries = {}
+
+
+    def entryAt(self, row, v):
+        """Returns the probability of value position v in the given row,
+        without building the row"""
+        explicit = self.entries.get(row)
+        if explicit is not None and v in explicit:
+            return explicit[v]
+        return self.rowDefaults.get(row, self.default)
+
+
+    def rowAt(self, row):
+        """Returns a new list of the probabilities in the given row"""
+        probs = [self.rowDefaults.get(row, self.default)] * len(self.values)
+        for v, prob in self.entries.get(row, {}).items():
+            probs[v] = prob
+        return probs
+
+
+    def setValue(self, value, givens, prob):
+        """Sets P(value | givens) to the given probability. The entry is
+        always stored, even if it equals the current default, so that it
+        keeps its value if the default changes later (see compact)"""
+        row = self.rowIndex(givens)
+        explicit = self.entries.get(row)
+        if explicit is None:
+            explicit = {}
+            self.entries[row] = explicit
+        explicit[self.valueIndex[value]] = prob
+
+
+    def setRowDefault(self, givens, prob):
+        """Sets the probability of every entry in the row for the given
+        parent values that has not been set explicitly"""
+        row = self.rowIndex(givens)
+        self.rowDefaults[row] = prob
+
+
+    def setDefault(self, prob):
+        """Sets the probability of every entry, in a row without a default of
+        its own, that has not been set explicitly"""
+        self.default = prob
+
+
+    def compact(self):
+        """Drops every explicit entry that equals its row's default. The
+        table reads the same afterwards, but a dropped entry would follow
+        any later change of the default, so only call this once the
+        defaults are final"""
+        for row in list(self.entries):
+            default = self.rowDefaults.get(row, self.default)
+            explicit = {v: prob for v, prob in self.entries[row].items() if prob != default}
+            if explicit == {}:
+                del self.entries[row]
+            else:
+                self.entries[row] = explicit
+
+
+    def rowsSumToOne(self, tolerance):
+        """Returns whether every row's probabilities add up to one, to
+        within the given tolerance. Only rows with explicit entries or a
+        default of their own are summed one by one; all the other rows are
+        just the table's default repeated, so they are checked once"""
+        card = len(self.values)
+        for row in set(self.entries) | set(self.rowDefaults):
+            explicit = self.entries.get(row, {})
+            total = sum(explicit.values()) + (card - len(explicit)) * self.rowDefaults.get(row, self.default)
+            if abs(total - 1.0) > tolerance:
+                return False
+        numSpecial = len(set(self.entries) | set(self.rowDefaults))
+        if numSpecial < tableSize(self.parentCards) and abs(card * self.default - 1.0) > tolerance:
+            return False
+        return True
+
+
+    def numEntries(self):
+        """Returns the number of explicitly stored entries"""
+        return sum(len(explicit) for explicit in self.entries.values())
+
+
+    def support(self, givens):
+        """Returns the list of (value, probability) pairs of the row for the
+        given parent values whose probability is not zero"""
+        probs = self.rowAt(self.rowIndex(givens))
+        return [(value, prob) for value, prob in zip(self.values, probs) if prob != 0.0]
+
+
+    def flatView(self):
+        """Returns a read-only, list-like view of the flat table whose rows
+        are only built when they are read (see compiledNet.py)"""
+        return FlatView(self)
+
+
+def sparseFromDict(values, parentValues, cpt, default=0.0):
+    """Given a node's values, its parents' values, and its CPT as nested
+    dictionaries, builds the matching SparseCPT, storing only the entries
+    that differ from the default"""
+    sparse = SparseCPT(values, parentValues, default)
+    for value in cpt:
+        for givens in cpt[value]:
+            sparse.setValue(value, givens, cpt[value][givens])
+    sparse.compact()
+    return sparse
@@ -0,0 +1,64 @@
+""" Defines an array-backed conditional probability table, an alternative to the
+nested dictionaries BayesNet uses by default"""
+
+import numpy as np
+
+from BayesNet.cptBase import CPTBase
+from BayesNet.factors import tableSize
+
+
+class TensorCPT(CPTBase):
+    """Stores the CPT of one node as a contiguous 2-D array. Each row holds
+    the probabilities of the node's values for one combination of parent
+    values, and rows are numbered by the mixed-radix code of the parents'
+    value positions (the first parent changing slowest, as in
+    recGivensBuild). Indexing with cpt[value][givens] works just like the
+    nested dictionaries, so older code that reads self.cpts directly still
+    works."""
+
+    backend = "tensor"
+
+    def __init__(self, values, parentValues, table=None):
+        """Takes in the list of the node's values and a list holding the list
+        of values for each parent, in CPT order. The table starts out all
+        zeros unless an array of the right shape is given"""
+        CPTBase.__init__(self, values, parentValues)
+        shape = (tableSize(self.parentCards), len(self.values))
+        if table is None:
+            self.table = np.zeros(shape)
+        else:
+            self.table = np.ascontiguousarray(table, dtype=np.float64).reshape(shape)
+
+
+    def rowAt(self, row):
+        return self.table[row].tolist()
+
+
+    def entryAt(self, row, v):
+        return self.table.item(row, v)
+
+
+    def rowsSumToOne(self, tolerance):
+        return bool(np.all(np.abs(self.table.sum(axis=1) - 1.0) <= tolerance))
+
+
+    def setValue(self, value, givens, prob):
+        """Sets P(value | givens) to the given probability"""
+        self.table[self.rowIndex(givens), self.valueIndex[value]] = prob
+
+
+    def flatTable(self):
+        """Returns the whole table as one flat list, rows one after another,
+        which is the layout of a factor over the parents followed by the
+        node"""
+        return self.table.ravel().tolist()
+
+
+def tensorFromDict(values, parentValues, cpt):
+    """Given a node's values, its parents' values, and its CPT as nested
+    dictionaries, builds the matching TensorCPT. Missing entries stay 0.0"""
+    tensor = TensorCPT(values, parentValues)
+    for value in cpt:
+        for givens in cpt[value]:
+            tensor.setValue(value, givens, cpt[value][givens])
+    return tensor
@@ -0,0 +1,152 @@
+""" Implements variable elimination over lists of factors, with pluggable
+heuristics for choosing the elimination order"""
+
+import heapq
+
+from BayesNet.factors import multiplyAll
+
+
+# ======================================================================
+# Elimination-order heuristics. Each one takes the current interaction
+# graph (a dictionary mapping each variable to the set of its neighbors),
+# a candidate variable, and a dictionary of cardinalities, and returns the
+# cost of eliminating that variable next. Lower is better.
+
+def minDegreeCost(graph, var, cards):
+    """The cost of eliminating a variable is the number of its neighbors"""
+    return len(graph[var])
+
+
+def minFillCost(graph, var, cards):
+    """The cost of eliminating a variable is the number of edges that must
+    be added to connect all of its neighbors to each other"""
+    neighbors = list(graph[var])
+    fill = 0
+    for i in range(len(neighbors)):
+        for j in range(i + 1, len(neighbors)):
+            if neighbors[j] not in graph[neighbors[i]]:
+                fill += 1
+    return fill
+
+
+def weightedMinFillCost(graph, var, cards):
+    """Like min-fill, but each fill edge is weighted by the product of the
+    cardinalities of the two variables it connects"""
+    neighbors = list(graph[var])
+    fill = 0
+    for i in range(len(neighbors)):
+        for j in range(i + 1, len(neighbors)):
+            if neighbors[j] not in graph[neighbors[i]]:
+                fill += cards[neighbors[i]] * cards[neighbors[j]]
+    return fill
+
+
+HEURISTICS = {"min-degree": minDegreeCost,
+              "min-fill": minFillCost,
+              "weighted-min-fill": weightedMinFillCost}
+
+
+def lookupHeuristic(heuristic):
+    """Given either the name of a heuristic or a cost function, returns the
+    cost function"""
+    if callable(heuristic):
+        return heuristic
+    if heuristic not in HEURISTICS:
+        raise ValueError("Unknown elimination heuristic: " + str(heuristic))
+    return HEURISTICS[heuristic]
+
+
+def interactionGraph(factors):
+    """Builds the undirected interaction graph of a list of factors: two
+    variables are neighbors if they appear together in some factor. Returns
+    the graph and a dictionary of cardinalities."""
+    graph = {}
+    cards = {}
+    for factor in factors:
+        for var, card in zip(factor.variables, factor.cards):
+            cards[var] = card
+            if var not in graph:
+                graph[var] = set()
+            for other in factor.variables:
+                if other != var:
+                    graph[var].add(other)
+    return graph, cards
+
+
+def eliminationOrder(factors, toEliminate, heuristic="min-fill"):
+    """Given a list of factors and the variables to be eliminated, greedily
+    builds an elimination order by repeatedly choosing the cheapest variable
+    according to the heuristic, and connecting its neighbors as eliminating
+    it would. Ties go to the variable listed first in toEliminate.
+
+    Costs are kept in a heap. Eliminating a variable can only change the
+    costs of its neighbors and of their neighbors, so only those are
+    recomputed; stale heap entries are skipped when they come up."""
+    costOf = lookupHeuristic(heuristic)
+    graph, cards = interactionGraph(factors)
+    rank = {}
+    for var in toEliminate:
+        if var in graph and var not in rank:
+            rank[var] = len(rank)
+    cost = {var: costOf(graph, var, cards) for var in rank}
+    heap = [(cost[var], rank[var], var) for var in rank]
+    heapq.heapify(heap)
+    order = []
+    while heap != []:
+        (varCost, varRank, var) = heapq.heappop(heap)
+        if var not in cost or cost[var] != varCost:
+            continue
+        order.append(var)
+        del cost[var]
+        neighbors = graph.pop(var)
+        for n in neighbors:
+            graph[n].discard(var)
+            graph[n].update(neighbors)
+            graph[n].discard(n)
+        affected = set(neighbors)
+        for n in neighbors:
+            affected.update(graph[n])
+        for n in affected:
+            if n in cost:
+                newCost = costOf(graph, n, cards)
+                if newCost != cost[n]:
+                    cost[n] = newCost
+                    heapq.heappush(heap, (newCost, rank[n], n))
+    return order
+
+
+def eliminateVariables(factors, order):
+    """Sums the variables out of a list of factors, one at a time in the
+    given order. For each variable, only the factors that mention it are
+    multiplied together. Returns the list of remaining factors."""
+    factors = list(factors)
+    for var in order:
+        bucket = []
+        rest = []
+        for factor in factors:
+            if var in factor.variables:
+                bucket.append(factor)
+            else:
+                rest.append(factor)
+        if bucket != []:
+            rest.append(multiplyAll(bucket).sumOut(var))
+        factors = rest
+    return factors
+
+
+def variableElimination(factors, queryVars, evidence, heuristic="min-fill"):
+    """Takes a list of factors, a list of query variables, and a dictionary
+    mapping evidence variables to value indices. Reduces every factor by the
+    evidence, eliminates all other variables, and returns the (unnormalized)
+    factor over the query variables. With no query variables the result is a
+    constant factor holding the probability of the evidence."""
+    reduced = [factor.reduce(evidence) for factor in factors]
+    hidden = []
+    seen = set(queryVars)
+    for factor in reduced:
+        for var in factor.variables:
+            if var not in seen:
+                seen.add(var)
+                hidden.append(var)
+    order = eliminationOrder(reduced, hidden, heuristic)
+    return multiplyAll(eliminateVariables(reduced, order))
@@ -0,0 +1,170 @@
+""" Vectorized samplers that work on a CompiledNet with NumPy, drawing a whole
+column of samples for one node at a time"""
+
+import numpy as np
+
+
+class SampleSet:
+    """A compact, columnar set of samples. For each node there is one array
+    of value ids (one entry per sample), in the CompiledNet's node order.
+    Values are only turned back into strings when asked for."""
+
+    def __init__(self, compiled, columns):
+        self.compiled = compiled
+        self.columns = columns
+
+    def __len__(self):
+        if self.columns == []:
+            return 0
+        return len(self.columns[0])
+
+    def column(self, nodeName):
+        """Returns the array of value ids sampled for the named node"""
+        return self.columns[self.compiled.nodeId[nodeName]]
+
+    def counts(self, nodeName):
+        """Returns a dictionary mapping each of the node's values to the
+        number of samples in which it was drawn"""
+        node = self.compiled.nodeId[nodeName]
+        counts = np.bincount(self.columns[node], minlength=self.compiled.cards[node])
+        return dict(zip(self.compiled.values[node], counts.tolist()))
+
+    def sample(self, i):
+        """Returns sample number i as a dictionary of node names and values"""
+        return self.compiled.decodeAssignment([int(col[i]) for col in self.columns])
+
+    def toDicts(self):
+        """Returns every sample as a dictionary, in the same format as
+        BayesNet.priorSampling. This undoes the savings of the columnar form,
+        so it is meant for small sample sets"""
+        return [self.sample(i) for i in range(len(self))]
+
+
+def cumulativeRows(table):
+    """Returns the row-wise cumulative sums of a 2-D table, with each row
+    rescaled to end at exactly 1.0, guarding against rows that do not quite
+    sum to one"""
+    cumulative = np.cumsum(table, axis=1)
+    totals = cumulative[:, -1:].copy()
+    totals[totals == 0.0] = 1.0
+    return cumulative / totals
+
+
+class VectorTables:
+    """The CPTs of a CompiledNet converted to 2-D arrays (one row per
+    combination of parent values), along with their row-wise cumulative
+    sums, ready for batched inverse-CDF draws. A CPT held as a lazy
+    FlatView (a parametric or sparse CPT) is never expanded: each batch
+    only gathers the rows its samples' parent values select."""
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.tables = []
+        self.cumulative = []
+        self.lazy = []
+        for node in range(len(compiled)):
+            table = compiled.tables[node]
+            if hasattr(table, "rowProbs"):
+                self.tables.append(None)
+                self.cumulative.append(None)
+                self.lazy.append(table)
+                continue
+            table = np.asarray(table, dtype=np.float64).reshape(-1, compiled.cards[node])
+            self.tables.append(table)
+            self.cumulative.append(cumulativeRows(table))
+            self.lazy.append(None)
+        self.valueDtype = np.int8 if max(compiled.cards, default=1) <= 127 else np.int32
+
+
+    def rows(self, node, columns, size):
+        """Returns, for every sample, the CPT row of the node selected by the
+        parents' sampled value ids"""
+        rows = np.zeros(size, dtype=np.int64)
+        for p, stride in zip(self.compiled.parents[node], self.compiled.parentStrides[node]):
+            rows += columns[p].astype(np.int64) * stride
+        return rows
+
+
+    def gather(self, node, rows):
+        """Returns the table for the node's CPT rows and each sample's row
+        within it. For a lazy CPT the table holds just the distinct rows
+        the samples use; otherwise it is the whole CPT"""
+        view = self.lazy[node]
+        if view is None:
+            return self.tables[node], rows
+        used, local = np.unique(rows, return_inverse=True)
+        table = np.array([view.rowProbs(int(row)) for row in used], dtype=np.float64)
+        return table.reshape(-1, self.compiled.cards[node]), local
+
+
+    def probabilities(self, node, rows, value):
+        """Returns, for every sample, the probability of the given value id
+        in the sample's CPT row"""
+        table, local = self.gather(node, rows)
+        return table[local, value]
+
+
+    def draw(self, node, rows, rng):
+        """Draws one value id per sample for the node, given each sample's
+        CPT row, with a single inverse-CDF lookup over the batch"""
+        if self.lazy[node] is None:
+            cumulative = self.cumulative[node]
+        else:
+            table, rows = self.gather(node, rows)
+            cumulative = cumulativeRows(table)
+        u = rng.random(len(rows))
+        if cumulative.shape[0] == 1:
+            values = np.searchsorted(cumulative[0], u, side="right")
+        else:
+            values = (u[:, None] >= cumulative[rows]).sum(axis=1)
+        np.minimum(values, cumulative.shape[1] - 1, out=values)
+        return values.astype(self.valueDtype)
+
+
+def priorSampleColumns(tables, numSamples, seed=None):
+    """Draws numSamples samples from the prior, visiting the nodes in
+    topological order and sampling each node's whole column at once. The
+    seed may be anything np.random.default_rng accepts, including a
+    Generator. Returns a SampleSet."""
+    rng = np.random.default_rng(seed)
+    columns = []
+    for node in range(len(tables.compiled)):
+        rows = tables.rows(node, columns, numSamples)
+        columns.append(tables.draw(node, rows, rng))
+    return SampleSet(tables.compiled, columns)
+
+
+def likelihoodWeightColumns(tables, evidence, numSamples, seed=None):
+    """Generates numSamples likelihood-weighted samples column by column.
+    The evidence is a dictionary mapping node ids to value ids; evidence
+    columns are filled with their fixed value, and each one adds the log of
+    its probability (given its parents' columns) to the samples' log-weights.
+    Working in log space keeps the weights from underflowing when there is a
+    lot of evidence. Returns the SampleSet and the array of log-weights."""
+    rng = np.random.default_rng(seed)
+    columns = []
+    logWeights = np.zeros(numSamples)
+    with np.errstate(divide="ignore"):
+        for node in range(len(tables.compiled)):
+            rows = tables.rows(node, columns, numSamples)
+            if node in evidence:
+                value = evidence[node]
+                columns.append(np.full(numSamples, value, dtype=tables.valueDtype))
+                logWeights += np.log(tables.probabilities(node, rows, value))
+            else:
+                columns.append(tables.draw(node, rows, rng))
+    return SampleSet(tables.compiled, columns), logWeights
+
+
+def weightedDistribution(samples, logWeights, node):
+    """Given weighted samples and their log-weights, estimates the
+    distribution of a node (given by id) with one weighted bincount. Returns
+    the list of probabilities indexed by value id, or None if every sample
+    has zero weight."""
+    top = logWeights.max() if len(logWeights) > 0 else float("-inf")
+    if top == float("-inf"):
+        return None
+    weights = np.exp(logWeights - top)
+    totals = np.bincount(samples.columns[node], weights=weights,
+                         minlength=samples.compiled.cards[node])
+    return (totals / totals.sum()).tolist()
@@ -20,6 +20,62 @@ def weightedSelection(values, probs):
     assert False, "Shouldn't get here"
         
         
+class AliasTable:
+    """A table for drawing from one fixed discrete distribution in constant
+    time, whatever its size (Walker's alias method, as built by Vose). The
+    range is split into equal-width columns, one per value; each column holds
+    its own value up to some cutoff and an alias value above it, so a draw
+    is one random number, one index and one comparison. The probabilities
+    need not sum to one. Building the table takes linear time, so it only
+    pays off for a distribution that is drawn from repeatedly, such as one
+    row of a CPT."""
+
+    def __init__(self, probs):
+        size = len(probs)
+        self.size = size
+        total = sum(probs)
+        self.cutoffs = [1.0] * size
+        self.aliases = list(range(size))
+        if total <= 0.0:
+            # No value is possible: always give the last one, as the
+            # cumulative scan does
+            self.cutoffs = [0.0] * size
+            self.aliases = [size - 1] * size
+            return
+        scaled = [p * size / total for p in probs]
+        small = [i for i in range(size) if scaled[i] < 1.0]
+        large = [i for i in range(size) if scaled[i] >= 1.0]
+        while small != [] and large != []:
+            less = small.pop()
+            more = large.pop()
+            self.cutoffs[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left over is 1.0 up to round-off, so those columns keep
+        # their own value all the way up (but never one with no probability)
+        for i in small + large:
+            if probs[i] > 0.0:
+                self.cutoffs[i] = 1.0
+                self.aliases[i] = i
+            else:
+                self.cutoffs[i] = 0.0
+                self.aliases[i] = max(range(size), key=lambda j: probs[j])
+
+    def draw(self, rand=random.random):
+        """Returns the index of a randomly chosen value, using one call to rand"""
+        position = rand() * self.size
+        column = int(position)
+        if column >= self.size:
+            column = self.size - 1
+        if position - column < self.cutoffs[column]:
+            return column
+        return self.aliases[column]
+
+
 def normalize(probList):
     """Given a list of probabilities, re-scale them so that they add up to
     one (applying the alpha term to the distribution). Builds and returns